@@ -1,58 +1,31 @@
-import os, glob, sys, re, math
+import os, glob, sys, re, math, itertools
 import numpy as np
-import xyzgeom
+import xyzgeom, qcscan, qcrawl, qtime
 
+AU_TO_MVCM = 5.142E+3
+ANGS_TO_BOHR = 1.88973
+
+@qtime.timed()
 def parse_efield(efld_file, infile, second_only=False):
     fr = open(infile, 'r')
-    start_parsing = False
-    begin = -1
-    end = -1
-    efield = np.array([])
-    efield_temp = None
-    N = -1
-    job_counter = 0
-    for line in fr.readlines():
-        l_sp = line.split()
-        if len(l_sp) == 1 and l_sp[0] == 'EField':
-            job_counter += 1
-            if not (second_only and job_counter == 1):
-                start_parsing = True
-                counter = 0
-            continue
-        if len(l_sp) > 2 and l_sp[1] == 'DONE':
-            if not (second_only and job_counter == 1):
-                break
-        if start_parsing:
-            if second_only and job_counter == 1:
-                continue
-            #print line
-            if counter == 0: #atom index
-                begin = int(l_sp[0])
-                end = int(l_sp[-1])
-                N = end - begin + 1
-                efield_temp = np.zeros((N, 3))
-                counter += 1
-            else:
-                for idx in range(N):
-                    efield_temp[idx][counter-1] = float(l_sp[idx+1])
-                if counter == 3:
-                    if len(efield) == 0:
-                        efield = efield_temp
-                    else:
-                        efield = np.vstack((efield, efield_temp))
-                    counter = 0
-                else:
-                    counter += 1
+    efield = qcscan.parse_efield_lines(fr, second_only)
     fr.close()
     #dump field to file
     np.savetxt(efld_file, efield, fmt="%.7f")
 
 def generate_efield_file(efld_file, outfile, second_only=False):
-    tmpfile = outfile+".tmp"
-    command = "sed -n " + "'/ EField /,/DONE ESP/p' " + outfile + " > " + tmpfile
-    os.system(command)
-    parse_efield(efld_file, tmpfile, second_only)
-    os.system('rm '+tmpfile)
+    if second_only:
+        efield = qcscan.scan_output(outfile, ["EField2"])["EField2"]
+    else:
+        efield = qcscan.scan_output(outfile, ["EField"])["EField"]
+    np.savetxt(efld_file, efield, fmt="%.7f")
+
+#parse the field and the ESP with a single read of the output
+def generate_efield_esp_files(efld_file, esp_file, outfile, second_only=False):
+    sec_efield = "EField2" if second_only else "EField"
+    results = qcscan.scan_output(outfile, [sec_efield, "TotESP"])
+    np.savetxt(efld_file, results[sec_efield], fmt="%.7f")
+    np.savetxt(esp_file, results["TotESP"], fmt="%.7f")
    
 def get_bond_direction(xyzfile, atom_idx1, atom_idx2):
     atomlist, coords = xyzgeom.parse_xyz_file(xyzfile)
@@ -60,73 +33,199 @@ def get_bond_direction(xyzfile, atom_idx1, atom_idx2):
     direction /= np.linalg.norm(direction)
     return direction
 
+@qtime.timed()
 def calculate_efield_on_bond_qcout(outfile, xyzfile, bond_idx1, bond_idx2, second_only=False):
    efld_file = outfile + ".efld"
    generate_efield_file(efld_file, outfile, second_only)
-   au_to_MVcm = 5.142E+3
    dir_bond = get_bond_direction(xyzfile, bond_idx1, bond_idx2)
    efield_all = np.loadtxt(efld_file)
-   E_atom1 = np.dot(efield_all[bond_idx1-1, :], dir_bond) * au_to_MVcm
-   E_atom2 = np.dot(efield_all[bond_idx2-1, :], dir_bond) * au_to_MVcm
+   E_atom1 = np.dot(efield_all[bond_idx1-1, :], dir_bond) * AU_TO_MVCM
+   E_atom2 = np.dot(efield_all[bond_idx2-1, :], dir_bond) * AU_TO_MVCM
    E_bond = 0.5 * (E_atom1 + E_atom2)
    return E_bond
 
 #This function is useful when multiple bonds are needed for one output (more efficient)
 def calculate_efield_on_bond(efld_file, xyzfile, bond_idx1, bond_idx2):
-   au_to_MVcm = 5.142E+3
    dir_bond = get_bond_direction(xyzfile, bond_idx1, bond_idx2)
    efield_all = np.loadtxt(efld_file)
-   E_atom1 = np.dot(efield_all[bond_idx1-1, :], dir_bond) * au_to_MVcm
-   E_atom2 = np.dot(efield_all[bond_idx2-1, :], dir_bond) * au_to_MVcm
+   E_atom1 = np.dot(efield_all[bond_idx1-1, :], dir_bond) * AU_TO_MVCM
+   E_atom2 = np.dot(efield_all[bond_idx2-1, :], dir_bond) * AU_TO_MVCM
    E_bond = 0.5 * (E_atom1 + E_atom2)
    return E_bond
 
+@qtime.timed()
 def parse_esp(esp_file, tmpfile):
    fr = open(tmpfile, 'r')
-   raw_data = []
-   count = 0
-   for line in fr.readlines():
-      l_sp = line.split()
-      if l_sp[0] == 'TotESP':
-         count += 1
-      if len(l_sp) == 2 and re.search('(\d+)', l_sp[0]) != None:
-         raw_data.append(float(l_sp[1]))
+   esp = qcscan.parse_esp_lines(fr)
    fr.close()
-   if count == 2:
-      esp = np.array(raw_data[len(raw_data)/2 : ])
-   else:
-      esp = np.array(raw_data)
    np.savetxt(esp_file, esp, fmt="%.7f")
 
 def generate_esp_file(esp_file, outfile):
-   tmpfile = "tmp.txt"
-   command = "sed -n " + "'/TotESP/,/Ele EField/p' " + outfile + " > " + tmpfile
-   os.system(command)
-   parse_esp(esp_file, tmpfile)
-   os.system('rm ' + tmpfile)
+   esp = qcscan.scan_output(outfile, ["TotESP"])["TotESP"]
+   np.savetxt(esp_file, esp, fmt="%.7f")
 
 def get_bond_length(xyzfile, atom_idx1, atom_idx2):
     atomlist, coords = xyzgeom.parse_xyz_file(xyzfile)
     bond_length = xyzgeom.compute_distance(coords, atom_idx1, atom_idx2)
     return bond_length
 
+@qtime.timed()
 def calculate_efield_from_esp_qcout(outfile, xyzfile, atom_idx1, atom_idx2):
    esp_file = outfile + ".esp"
    generate_esp_file(esp_file, outfile)
-   au_to_MVcm = 5.142E+3
    esp_all = np.loadtxt(esp_file)
    V_1 = esp_all[atom_idx1-1]
    V_2 = esp_all[atom_idx2-1]
-   r_bond = get_bond_length(xyzfile, atom_idx1, atom_idx2) * 1.88973 #convert from A to Bohr (au)
-   E_bond = (V_1 - V_2) / r_bond * au_to_MVcm
+   r_bond = get_bond_length(xyzfile, atom_idx1, atom_idx2) * ANGS_TO_BOHR
+   E_bond = (V_1 - V_2) / r_bond * AU_TO_MVCM
    return E_bond
 
 #This function is useful when multiple bonds are needed for one output (more efficient)
 def calculate_efield_from_esp(esp_file, xyzfile, atom_idx1, atom_idx2):
-   au_to_MVcm = 5.142E+3
    esp_all = np.loadtxt(esp_file)
    V_1 = esp_all[atom_idx1-1]
    V_2 = esp_all[atom_idx2-1]
-   r_bond = get_bond_length(xyzfile, atom_idx1, atom_idx2) * 1.88973 #convert from A to Bohr (au)
-   E_bond = (V_1 - V_2) / r_bond * au_to_MVcm
+   r_bond = get_bond_length(xyzfile, atom_idx1, atom_idx2) * ANGS_TO_BOHR
+   E_bond = (V_1 - V_2) / r_bond * AU_TO_MVCM
+   return E_bond
+
+#Batch versions: M bonds over N frames in one call
+#bond_list is a list of (idx1, idx2) pairs (starting from 1); each file is loaded only once
+@qtime.timed()
+def load_frames(file_list, loader):
+   frames = [loader(filename) for filename in file_list]
+   if len(set([frame.shape for frame in frames])) == 1:
+      return np.array(frames)
+   return frames  #different number of atoms per frame: keep them as a list
+
+def load_xyz_coords(xyzfile):
+   atomlist, coords = xyzgeom.parse_xyz_file(xyzfile)
+   return coords
+
+#efield: (..., natoms, 3) in au; coords: (..., natoms, 3) in Angstrom; the leading axes broadcast,
+#e.g. (N,) frames, or (C, F) cutoffs x frames of field over (F,) geometries
+#returns the projections (..., M) of the field on the two end atoms of every bond in au
+def bond_end_fields(efield, coords, bond_list):
+   bonds = np.array(bond_list, dtype=int) - 1
+   dir_bond = coords[..., bonds[:, 1], :] - coords[..., bonds[:, 0], :]
+   dir_bond = dir_bond / np.linalg.norm(dir_bond, axis=-1)[..., np.newaxis]
+   E_atom1 = np.einsum('...mk,...mk->...m', efield[..., bonds[:, 0], :], dir_bond)
+   E_atom2 = np.einsum('...mk,...mk->...m', efield[..., bonds[:, 1], :], dir_bond)
+   return E_atom1, E_atom2
+
+#the two end atoms separately: (..., M) each in MV/cm
+def project_atoms_on_bonds(efield, coords, bond_list):
+   E_atom1, E_atom2 = bond_end_fields(efield, coords, bond_list)
+   return E_atom1 * AU_TO_MVCM, E_atom2 * AU_TO_MVCM
+
+#average of the two end atoms: (..., M) in MV/cm
+def project_efield_on_bonds(efield, coords, bond_list):
+   E_atom1, E_atom2 = bond_end_fields(efield, coords, bond_list)
+   return 0.5 * (E_atom1 + E_atom2) * AU_TO_MVCM
+
+#esp: (..., natoms) in au; coords: (..., natoms, 3) in Angstrom, leading axes as above; returns (..., M) in MV/cm
+def project_esp_on_bonds(esp, coords, bond_list):
+   bonds = np.array(bond_list, dtype=int) - 1
+   r_bond = np.linalg.norm(coords[..., bonds[:, 1], :] - coords[..., bonds[:, 0], :], axis=-1) * ANGS_TO_BOHR
+   return (esp[..., bonds[:, 0]] - esp[..., bonds[:, 1]]) / r_bond * AU_TO_MVCM
+
+#data and coords: arrays over the frames, or lists if the number of atoms differs between frames
+def apply_on_frames(kernel, data, coords, bond_list):
+   if isinstance(data, np.ndarray) and isinstance(coords, np.ndarray):
+      return kernel(data, coords, bond_list)
+   E_bond = np.zeros((len(data), len(bond_list)))
+   for iframe in range(len(data)):
+      E_bond[iframe] = kernel(data[iframe], coords[iframe], bond_list)
    return E_bond
+
+def calculate_efield_on_bonds_batch(efld_files, xyz_files, bond_list):
+   efield = load_frames(efld_files, lambda efld_file: np.loadtxt(efld_file, ndmin=2))
+   coords = load_frames(xyz_files, load_xyz_coords)
+   return apply_on_frames(project_efield_on_bonds, efield, coords, bond_list)
+
+def calculate_efield_from_esp_batch(esp_files, xyz_files, bond_list):
+   esp = load_frames(esp_files, lambda esp_file: np.loadtxt(esp_file, ndmin=1))
+   coords = load_frames(xyz_files, load_xyz_coords)
+   return apply_on_frames(project_esp_on_bonds, esp, coords, bond_list)
+
+#both methods at once, sharing the geometries
+@qtime.timed()
+def calculate_bond_efield_batch(efld_files, esp_files, xyz_files, bond_list):
+   coords = load_frames(xyz_files, load_xyz_coords)
+   efield = load_frames(efld_files, lambda efld_file: np.loadtxt(efld_file, ndmin=2))
+   esp = load_frames(esp_files, lambda esp_file: np.loadtxt(esp_file, ndmin=1))
+   E_avg = apply_on_frames(project_efield_on_bonds, efield, coords, bond_list)
+   E_esp = apply_on_frames(project_esp_on_bonds, esp, coords, bond_list)
+   return E_avg, E_esp
+
+#Cutoff-convergence analysis: the probe-atom rows of the r[cutoff]_frame_[frame]_*.efld (or
+#.esp) files of all the cutoffs are gathered into one (C, F, A, ncol) array, with the frames
+#missing for a cutoff left as NaN, and the bond projections (the kernels above over the probe
+#atoms, with the (F, A, 3) geometries broadcast over the cutoffs), the subtraction of a reference
+#cutoff and the statistics are then done for all the cutoffs at once
+#the directory is listed once for all the cutoffs (same files as glob r[cutoff:.2f]_frame*[suffix])
+def cutoff_frame_files(target_dir, cutoff_values, suffix):
+   prefixes = dict([("r{:.2f}_frame".format(cutoff), cutoff) for cutoff in cutoff_values])
+   files = dict([(cutoff, {}) for cutoff in cutoff_values])
+   for name in sorted(os.listdir(target_dir)):
+      if not name.endswith(suffix) or "_frame" not in name:
+         continue
+      prefix = name[:name.index("_frame")+6]
+      if prefix in prefixes:
+         frame = int(re.search("frame_([^_]+)_", name).group(1))
+         files[prefixes[prefix]][frame] = target_dir+"/"+name
+   return files
+
+def xyz_frame_files(xyz_path):
+   files = {}
+   for xyzfile in glob.glob(xyz_path+'/'+'r*.xyz'):
+      frame = int(re.search("frame_([^_]+).xyz", xyzfile).group(1))
+      files[frame] = xyzfile
+   return files
+
+#only the lines up to the last probe atom are read
+def read_rows_worker(task):
+   filename, rows, ncol = task
+   fr = open(filename, 'r')
+   values = np.fromstring(''.join(itertools.islice(fr, int(rows.max())+1)), sep=' ')
+   fr.close()
+   return values.reshape(-1, ncol)[rows]
+
+#files[cutoff] = {frame: filename}; returns (C, F, A, ncol) and the (C, F) mask of the loaded frames
+@qtime.timed()
+def load_cutoff_frames(files, frames, atom_idx_list, ncol=3, nproc=1):
+   rows = np.array(atom_idx_list, dtype=int) - 1
+   data = np.full((len(files), len(frames), len(rows), ncol), np.nan)
+   loaded = np.zeros((len(files), len(frames)), dtype=bool)
+   tasks = []
+   slots = []
+   for icut, cutoff in enumerate(files):
+      for iframe, frame in enumerate(frames):
+         if frame in files[cutoff]:
+            tasks.append((files[cutoff][frame], rows, ncol))
+            slots.append((icut, iframe))
+   for (icut, iframe), values in zip(slots, qcrawl.map_files(read_rows_worker, tasks, nproc)):
+      data[icut, iframe] = values
+      loaded[icut, iframe] = True
+   qtime.count('efield.load_cutoff_frames', len(tasks), qtime.file_bytes([task[0] for task in tasks]))
+   return data, loaded
+
+#coordinates (F, A, 3) of the probe atoms (index starting from 1) in every frame
+@qtime.timed()
+def load_probe_coords(xyz_files, atom_idx_list):
+   rows = np.array(atom_idx_list, dtype=int) - 1
+   return np.array([load_xyz_coords(xyzfile)[rows] for xyzfile in xyz_files]).reshape(len(xyz_files), len(rows), 3)
+
+#data (C, F, ...) minus the data of the reference cutoff; frames without a reference become NaN
+def subtract_reference(data, loaded, iref):
+   return data - data[iref][np.newaxis], loaded & loaded[iref][np.newaxis]
+
+#stats[name] (C, M) -> table[cutoff][name_label]
+def stat_table(stats, cutoff_values, labels):
+   table = {}
+   for icut, cutoff in enumerate(cutoff_values):
+      table[cutoff] = {}
+      for name in stats:
+         for ilabel, label in enumerate(labels):
+            table[cutoff][name + "_" + label] = stats[name][icut, ilabel]
+   return table
@@ -0,0 +1,62 @@
+import os, sys, io
+import qtime
+
+#Shared engine for the make_input_* generators
+#The templates are read once for the whole method x basis x xyz loop: the rem files are
+#cached by qrems.load_rems and the verbatim input sections (solvent, isotopes, external
+#charges, ...) by section_text; the geometries are parsed as they come and not kept, so
+#memory does not grow with the number of inputs.
+#Every input is rendered into memory and written with a single write by the calling process.
+
+_section_cache = {}
+
+def section_text(filename):
+   if filename not in _section_cache:
+      fr = open(filename, 'r')
+      _section_cache[filename] = '\n' + fr.read()
+      fr.close()
+   return _section_cache[filename]
+
+#same as qrems.copy_section_over, but each file is only read once
+def copy_section_over(fw, filename):
+   fw.write(section_text(filename))
+
+#the $molecule blocks written by qmol.WriteMolecule and qmol.WriteMolecule_Frgm
+def molecule_block(XYZ, charge, mult):
+   return '$molecule\n%d %d\n' %(charge, mult) + XYZ.atom_text() + '$end\n\n'
+
+def molecule_frgm_block(XYZ, FRGM):
+   lines = ['$molecule\n', "%d %d\n" %(FRGM.total_charge, FRGM.total_mult)]
+   for ifrgm in range(0, FRGM.n_frgm):
+      lines.append('--\n')
+      lines.append("%d %d\n" %(FRGM.charge_frgm[ifrgm], FRGM.mult_frgm[ifrgm]))
+      lines.append(XYZ.atom_text(FRGM.bounds[ifrgm], FRGM.bounds[ifrgm+1]))
+   lines.append('$end\n\n')
+   return ''.join(lines)
+
+#the fragments in subsystem (indices from 0) only; the total charge is their sum and the
+#multiplicity the largest one (at most one open-shell fragment)
+def molecule_subsystem_block(XYZ, FRGM, subsystem):
+   mult_list = [FRGM.mult_frgm[ifrgm] for ifrgm in subsystem]
+   if len([mult for mult in mult_list if mult > 1]) > 1:
+      print("multiple open-shell fragments not allowed for now")
+      sys.exit(0)
+   lines = ['$molecule\n', "%d %d\n" %(sum([FRGM.charge_frgm[ifrgm] for ifrgm in subsystem]), max(mult_list + [1]))]
+   for ifrgm in subsystem:
+      lines.append('--\n')
+      lines.append("%d %d\n" %(FRGM.charge_frgm[ifrgm], FRGM.mult_frgm[ifrgm]))
+      lines.append(XYZ.atom_text(FRGM.bounds[ifrgm], FRGM.bounds[ifrgm+1]))
+   lines.append('$end\n\n')
+   return ''.join(lines)
+
+#creates inputfile from render(fw, *args) right away, so the caller may go on modifying its
+#rems afterwards
+def write_input(inputfile, render, *args):
+   with qtime.phase('qbatch.write_inputs', 1) as timer:
+      fw = io.StringIO()
+      render(fw, *args)
+      text = fw.getvalue()
+      fo = open(inputfile, 'w')
+      fo.write(text)
+      fo.close()
+      timer.nbytes = len(text)
@@ -0,0 +1,130 @@
+import os, sys, sqlite3, json
+import numpy as np
+
+#Persistent cache of the records parsed from each output file
+#The cache is a SQLite file at the root of the result tree. Records are keyed on the output path
+#(relative to that root) and the parser, and are only reused if the size and mtime of the output
+#are unchanged, so only new or modified outputs need to be scanned again.
+#Records are stored as plain JSON (arrays as nested lists with their dtype and shape), never as
+#pickles, so a cache file planted in a shared tree can not run code. A result tree that can not
+#be written to is parsed without the cache.
+
+CACHE_NAME = '.qcparse_cache.sqlite'
+
+#JSON-ready form of a record: numbers, strings, lists, tuples, dicts and numpy arrays
+def encode_record(record):
+   if isinstance(record, np.ndarray):
+      return {'ndarray': encode_record(record.tolist()), 'dtype': str(record.dtype), 'shape': list(record.shape)}
+   if isinstance(record, np.generic):
+      return record.item()
+   if isinstance(record, tuple):
+      return {'tuple': [encode_record(item) for item in record]}
+   if isinstance(record, list):
+      return [encode_record(item) for item in record]
+   if isinstance(record, dict):
+      return {'dict': [[encode_record(key), encode_record(value)] for key, value in record.items()]}
+   if record == None or isinstance(record, (str, int, float, bool)):
+      return record
+   raise TypeError("can not cache a record of type %s" %type(record).__name__)
+
+def decode_record(data):
+   if isinstance(data, list):
+      return [decode_record(item) for item in data]
+   if not isinstance(data, dict):
+      return data
+   if 'ndarray' in data:
+      return np.array(decode_record(data['ndarray']), dtype=data['dtype']).reshape(data['shape'])
+   if 'tuple' in data:
+      return tuple([decode_record(item) for item in data['tuple']])
+   return dict([(decode_hashable(key), decode_record(value)) for key, value in data['dict']])
+
+#dictionary keys come back as lists where they were tuples
+def decode_hashable(data):
+   value = decode_record(data)
+   if isinstance(value, list):
+      return tuple(value)
+   return value
+
+class ParseCache:
+   def __init__(self, root):
+      self.root = os.path.abspath(root)
+      self.path = os.path.join(self.root, CACHE_NAME)
+      self.conn = sqlite3.connect(self.path)
+      self.conn.execute('CREATE TABLE IF NOT EXISTS json_records (path TEXT, parser TEXT, size INTEGER, mtime INTEGER, data TEXT, PRIMARY KEY (path, parser))')
+      self.n_hit = 0
+      self.n_miss = 0
+      self.writable = True
+
+   def key(self, outfile):
+      return os.path.relpath(os.path.abspath(outfile), self.root)
+
+   #return (stamp, {parser: record}) with the records that are still valid for this output
+   def lookup(self, outfile, parsers):
+      st = os.stat(outfile)
+      stamp = (st.st_size, st.st_mtime_ns)
+      hits = {}
+      for parser in parsers:
+         row = self.conn.execute('SELECT size, mtime, data FROM json_records WHERE path = ? AND parser = ?', (self.key(outfile), parser)).fetchone()
+         if row != None and (row[0], row[1]) == stamp:
+            try:
+               hits[parser] = decode_record(json.loads(row[2]))
+            except (ValueError, TypeError, KeyError):
+               continue
+      if len(hits) == len(parsers):
+         self.n_hit += 1
+      else:
+         self.n_miss += 1
+      return stamp, hits
+
+   def store(self, outfile, parser, stamp, record):
+      if not self.writable:
+         return
+      try:
+         data = json.dumps(encode_record(record))
+      except TypeError:
+         return
+      try:
+         self.conn.execute('INSERT OR REPLACE INTO json_records VALUES (?, ?, ?, ?, ?)', (self.key(outfile), parser, stamp[0], stamp[1], data))
+      except sqlite3.Error as err:
+         print("parse cache %s can not be updated (%s): going on without storing" %(self.path, err))
+         self.writable = False
+
+   def close(self):
+      try:
+         self.conn.commit()
+      except sqlite3.Error as err:
+         print("parse cache %s can not be updated (%s)" %(self.path, err))
+      self.conn.close()
+      print("parse cache %s: %d outputs reused, %d outputs scanned" %(self.path, self.n_hit, self.n_miss))
+
+#the cache under root, or None (with a message) if it can not be opened or created there
+def connect(root):
+   try:
+      return ParseCache(root)
+   except (sqlite3.Error, OSError) as err:
+      print("parse cache unavailable under %s (%s): parsing without it" %(root, err))
+      return None
+
+def add_cache_options(parser):
+   parser.add_option('--no_cache','--no-cache',dest='no_cache',action='store_true',default=False,help='do not read or update the parse cache at the root of the result tree')
+   parser.add_option('--clear_cache',dest='clear_cache',action='store_true',default=False,help='remove the parse cache at the root of the result tree before parsing')
+
+#the root of the result tree: the given result dir, or the common parent of the output dirs
+def cache_root(result_dir, outdir_list):
+   if result_dir != None:
+      return result_dir
+   if len(outdir_list) == 0:
+      return os.getcwd()
+   return os.path.commonpath([os.path.abspath(outdir) for outdir in outdir_list])
+
+def open_cache(options, result_dir, outdir_list=[]):
+   root = cache_root(result_dir, outdir_list)
+   if options.clear_cache and os.path.exists(os.path.join(root, CACHE_NAME)):
+      print("removing the parse cache under %s" %root)
+      try:
+         os.remove(os.path.join(root, CACHE_NAME))
+      except OSError as err:
+         print("can not remove the parse cache under %s (%s)" %(root, err))
+   if options.no_cache:
+      return None
+   return connect(root)
@@ -0,0 +1,80 @@
+import os, sys
+import numpy as np
+import xyzgeom
+
+#Carving of QM and MM solvent regions around a solute
+#The first natoms_solute atoms of a snapshot are the solute and the rest are whole solvent
+#molecules of mol_size atoms each (water: 3). The distance of a molecule to the solute is the
+#shortest distance between any of its atoms and any solute atom; only the pairs within the
+#largest radius are looked at (cell list of xyzgeom.neighbor_pairs), the other molecules are
+#at an infinite distance. The molecules are sorted by this distance once per snapshot, so for
+#every QM cutoff r_qm the regions
+#   QM shell   d <= r_qm
+#   MM region  r_qm < d <= r_mm (all the other molecules with mm_all, none without r_mm)
+#are consecutive ranges of the sorted molecules, counted with searchsorted. The reordered
+#geometry (solute, QM shell, MM region) is the same for all the cutoffs up to the number of
+#atoms kept, which is all that changes in the FRGM (QM atoms, MM atoms).
+
+def check_solvent(natoms, natoms_solute, mol_size):
+   if natoms_solute > natoms or (natoms - natoms_solute) % mol_size != 0:
+      print("The %d solvent atoms can not be split into molecules of %d atoms" %(natoms - natoms_solute, mol_size))
+      sys.exit(1)
+
+#shortest solute distance of every solvent molecule (inf beyond r_max)
+def molecule_distances(Coords, natoms_solute, mol_size, r_max):
+   Coords = np.asarray(Coords, dtype=float)
+   check_solvent(len(Coords), natoms_solute, mol_size)
+   solvent = Coords[natoms_solute:]
+   dist = np.full(len(solvent), np.inf)
+   iS, iW = xyzgeom.neighbor_pairs(Coords[:natoms_solute], solvent, r_max)
+   np.minimum.at(dist, iW, np.linalg.norm(solvent[iW] - Coords[iS], axis=1))
+   return dist.reshape(-1, mol_size).min(axis=1)
+
+#number of QM and MM molecules for every cutoff from the sorted distances
+def region_counts(sorted_dist, qm_cutoffs, mm_radius=None, mm_all=False):
+   n_qm = np.searchsorted(sorted_dist, qm_cutoffs, side='right')
+   if mm_all:
+      n_mm = len(sorted_dist) - n_qm
+   elif mm_radius != None:
+      n_mm = np.maximum(np.searchsorted(sorted_dist, mm_radius, side='right') - n_qm, 0)
+   else:
+      n_mm = np.zeros_like(n_qm)
+   return n_qm, n_mm
+
+#atom order: the solute, then the molecules in the given order
+def reorder_atoms(natoms_solute, mol_size, mol_order):
+   solvent = natoms_solute + (np.asarray(mol_order)[:, np.newaxis] * mol_size + np.arange(mol_size)).ravel()
+   return np.concatenate((np.arange(natoms_solute), solvent)).astype(int)
+
+#one snapshot: the atom order shared by all the cutoffs and the QM/MM molecule counts per cutoff
+def carve_frame(Coords, natoms_solute, mol_size, qm_cutoffs, mm_radius=None, mm_all=False):
+   r_max = max(qm_cutoffs)
+   if mm_radius != None and not mm_all:
+      r_max = max(r_max, mm_radius)
+   dist = molecule_distances(Coords, natoms_solute, mol_size, r_max)
+   mol_order = np.argsort(dist, kind='stable')
+   n_qm, n_mm = region_counts(dist[mol_order], qm_cutoffs, mm_radius, mm_all)
+   return reorder_atoms(natoms_solute, mol_size, mol_order), n_qm, n_mm
+
+#the first natoms lines of the reordered geometry
+def write_carved_xyz(outfile, lines, natoms):
+   fw = open(outfile, 'w')
+   fw.write("%d\n\n" %natoms + ''.join(lines[:natoms]))
+   fw.close()
+
+#two fragments: the QM region (solute + QM shell) and the MM region, the solvent being neutral
+def write_carved_frgm(frgm_file, natoms_qm, natoms_mm, solute_chg=0, solute_mult=1):
+   fw = open(frgm_file, 'w')
+   fw.write('%d\n%d\n%d 0\n%d 1\n%d %d\n' %(solute_chg, solute_mult, solute_chg, solute_mult, natoms_qm, natoms_mm))
+   fw.close()
+
+#write r[cutoff]_[name].xyz/.frgm for every cutoff; returns the (QM, MM) molecule counts
+def carve_snapshot(dest_dir, name, elements, Coords, natoms_solute, mol_size, qm_cutoffs, mm_radius=None, mm_all=False, solute_chg=0, solute_mult=1):
+   order, n_qm, n_mm = carve_frame(Coords, natoms_solute, mol_size, qm_cutoffs, mm_radius, mm_all)
+   lines = xyzgeom.xyz_lines(np.asarray(elements)[order], np.asarray(Coords)[order])
+   for cutoff, nq, nm in zip(qm_cutoffs, n_qm, n_mm):
+      root = os.path.join(dest_dir, "r{:.2f}_".format(cutoff) + name)
+      natoms_qm = natoms_solute + nq * mol_size
+      write_carved_xyz(root + '.xyz', lines, natoms_qm + nm * mol_size)
+      write_carved_frgm(root + '.frgm', natoms_qm, nm * mol_size, solute_chg, solute_mult)
+   return n_qm, n_mm
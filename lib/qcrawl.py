@@ -0,0 +1,109 @@
+import os, glob, re, sys, fnmatch
+import multiprocessing as mp
+import qcscan, qtime
+
+#Crawl the Q-Chem outputs under a list of result directories
+#Files from all the directories are spread over a process pool (nproc > 1) and the records
+#come back grouped by directory, with the directories in the given order and the outputs
+#sorted by name, so the writers see the same data no matter how many processes are used.
+
+def list_outputs(outdir, pattern="*.out"):
+   return sorted(glob.glob(os.path.join(outdir, pattern)))
+
+def map_files(worker, tasks, nproc=1):
+   if nproc <= 1 or len(tasks) <= 1:
+      return [worker(task) for task in tasks]
+   chunksize = max(1, len(tasks) // (nproc * 4))
+   pool = mp.Pool(min(nproc, len(tasks)))
+   try:
+      results = pool.map(worker, tasks, chunksize)
+   finally:
+      pool.close()
+      pool.join()
+   return results
+
+def grep_worker(task):
+   outfile, flags = task
+   scanner = qcscan.Scanner()
+   for flag in flags:
+      scanner.add_section(flag, flag, None, qcscan.keep_lines)
+   return scanner.scan(outfile)
+
+def scan_worker(task):
+   outfile, section_list = task
+   return qcscan.scan_output(outfile, section_list)
+
+#worker(task) takes (outfile, item_list) and returns {item: result}, item being a grep flag or a section
+#cache: a qcache.ParseCache; only the items of the outputs that are new or have changed are scanned
+def crawl(outdir_list, worker, item_list, nproc=1, pattern="*.out", cache=None):
+   outfiles = []
+   owners = []
+   for outdir in outdir_list:
+      for outfile in list_outputs(outdir, pattern):
+         outfiles.append(outfile)
+         owners.append(outdir)
+   parsers = {}
+   for item in item_list:
+      parsers[item] = "%d:%s:%s" %(qcscan.PARSER_VERSION, worker.__name__, item)
+   results = []
+   tasks = []
+   task_index = []
+   stamps = []
+   for ifile in range(len(outfiles)):
+      cached = {}
+      if cache != None:
+         stamp, cached = cache.lookup(outfiles[ifile], [parsers[item] for item in item_list])
+      results.append({})
+      missing = []
+      for item in item_list:
+         if parsers[item] in cached:
+            results[ifile][item] = cached[parsers[item]]
+         else:
+            missing.append(item)
+      if len(missing) > 0:
+         tasks.append((outfiles[ifile], missing))
+         task_index.append(ifile)
+         if cache != None:
+            stamps.append(stamp)
+   with qtime.phase('qcrawl.scan_outputs', len(tasks), qtime.file_bytes([task[0] for task in tasks])):
+      new_results = map_files(worker, tasks, nproc)
+   qtime.count('qcrawl.cached_outputs', len(outfiles) - len(tasks))
+   for itask in range(len(tasks)):
+      results[task_index[itask]].update(new_results[itask])
+      if cache != None:
+         for item in new_results[itask]:
+            cache.store(tasks[itask][0], parsers[item], stamps[itask], new_results[itask][item])
+   records = {}
+   for outdir in outdir_list:
+      records[outdir] = []
+   for ifile in range(len(outfiles)):
+      records[owners[ifile]].append((os.path.basename(outfiles[ifile]), results[ifile]))
+   return records
+
+#records[outdir] = [(outname, {flag: matched lines}), ...]
+def grep_outputs(outdir_list, flags, nproc=1, pattern="*.out", cache=None):
+   return crawl(outdir_list, grep_worker, flags, nproc, pattern, cache)
+
+#records[outdir] = [(outname, {section: parsed result}), ...]
+def scan_outputs(outdir_list, section_list, nproc=1, pattern="*.out", cache=None):
+   return crawl(outdir_list, scan_worker, section_list, nproc, pattern, cache)
+
+#the equivalent of "grep -H flag *keyword*.out" inside one directory
+#for sections captured with trailing context (grep -A), pass the matched pattern so that
+#the context lines get the "name-" prefix as grep does
+def grep_lines(records, flag, keyword=None, pattern=None):
+   name_pattern = "*.out"
+   if keyword != None:
+      name_pattern = "*" + keyword + "*.out"
+   lines = []
+   for outname, matched in records:
+      if fnmatch.fnmatchcase(outname, name_pattern):
+         for line in matched[flag]:
+            if pattern == None or pattern in line:
+               lines.append(outname + ":" + line)
+            else:
+               lines.append(outname + "-" + line)
+   return lines
+
+def add_nproc_option(parser):
+   parser.add_option('-j','--nproc',dest='nproc',action='store',type='int',default=1,help='number of processes used to scan the output files (default: 1)')
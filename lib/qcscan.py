@@ -0,0 +1,320 @@
+import os, sys, re
+import numpy as np
+
+#bump this whenever a handler changes, so that cached records get parsed again
+PARSER_VERSION = 2
+
+#Single-pass scanner for Q-Chem outputs
+#Each section is a sed-like range: it opens on a line containing "start" and closes on the
+#next line containing "stop" (both lines included), and may open again later in the file.
+#A section without "stop" works like grep and only captures the lines containing "start";
+#an integer "stop" also captures that many lines after each match (grep -A), and a function
+#"stop" captures the lines after each match for as long as it accepts them.
+#All the lines captured for a section are handed to its handler once the file is read through.
+class Section:
+   def __init__(self, name, start, stop, handler):
+      self.name = name
+      self.start = start
+      self.stop = stop
+      self.handler = handler
+
+class Scanner:
+   def __init__(self):
+      self.sections = []
+
+   def add_section(self, name, start, stop, handler):
+      #stop = None or an int for grep-like sections, or a function accepting the lines to keep
+      self.sections.append(Section(name, start, stop, handler))
+
+   def scan(self, outfile):
+      nsec = len(self.sections)
+      starts = [sec.start for sec in self.sections]
+      stops = [sec.stop for sec in self.sections]
+      active = [False] * nsec
+      remaining = [0] * nsec
+      captured = [[] for isec in range(nsec)]
+      fr = open(outfile, 'r', errors='replace')
+      for line in fr:
+         for isec in range(nsec):
+            if stops[isec] == None:
+               if starts[isec] in line:
+                  captured[isec].append(line)
+            elif callable(stops[isec]):
+               if active[isec] and stops[isec](line):
+                  captured[isec].append(line)
+               elif starts[isec] in line:
+                  captured[isec].append(line)
+                  active[isec] = True
+               else:
+                  active[isec] = False
+            elif isinstance(stops[isec], int):
+               if starts[isec] in line:
+                  captured[isec].append(line)
+                  remaining[isec] = stops[isec]
+               elif remaining[isec] > 0:
+                  captured[isec].append(line)
+                  remaining[isec] -= 1
+            elif active[isec]:
+               captured[isec].append(line)
+               if stops[isec] in line:
+                  active[isec] = False
+            elif starts[isec] in line:
+               captured[isec].append(line)
+               active[isec] = True
+      fr.close()
+      results = {}
+      for isec, sec in enumerate(self.sections):
+         results[sec.name] = sec.handler(captured[isec])
+      return results
+
+#parsers working on the captured lines of each section
+def parse_efield_lines(lines, second_only=False):
+   start_parsing = False
+   efield = np.array([])
+   efield_temp = None
+   N = -1
+   counter = 0
+   job_counter = 0
+   for line in lines:
+      l_sp = line.split()
+      if len(l_sp) == 1 and l_sp[0] == 'EField':
+         job_counter += 1
+         if not (second_only and job_counter == 1):
+            start_parsing = True
+            counter = 0
+         continue
+      if len(l_sp) > 2 and l_sp[1] == 'DONE':
+         if not (second_only and job_counter == 1):
+            break
+      if start_parsing:
+         if counter == 0: #atom index
+            begin = int(l_sp[0])
+            end = int(l_sp[-1])
+            N = end - begin + 1
+            efield_temp = np.zeros((N, 3))
+            counter += 1
+         else:
+            efield_temp[:, counter-1] = [float(val) for val in l_sp[1:N+1]]
+            if counter == 3:
+               if len(efield) == 0:
+                  efield = efield_temp
+               else:
+                  efield = np.vstack((efield, efield_temp))
+               counter = 0
+            else:
+               counter += 1
+   return efield
+
+def parse_efield_lines_second(lines):
+   return parse_efield_lines(lines, second_only=True)
+
+def parse_esp_lines(lines):
+   raw_data = []
+   count = 0
+   for line in lines:
+      l_sp = line.split()
+      if len(l_sp) == 0:
+         continue
+      if l_sp[0] == 'TotESP':
+         count += 1
+      if len(l_sp) == 2 and re.search('(\d+)', l_sp[0]) != None:
+         raw_data.append(float(l_sp[1]))
+   if count == 2:
+      esp = np.array(raw_data[len(raw_data)//2 : ])
+   else:
+      esp = np.array(raw_data)
+   return esp
+
+def parse_mulliken_lines(lines):
+   AtomList = []
+   PopData = []
+   for line in lines:
+      l_sp = line.split()
+      if len(l_sp) == 0:
+         continue
+      elif l_sp[0] == "Atom":
+         AtomList = []
+         PopData = []
+      elif len(l_sp) == 3:
+         AtomList.append(l_sp[1])
+         PopData.append((float(l_sp[2]), 0.0))
+      elif len(l_sp) == 4:
+         AtomList.append(l_sp[1])
+         PopData.append( (float(l_sp[2]), float(l_sp[3])) )
+   return AtomList, np.array(PopData)
+
+def parse_becke_lines(lines):
+   AtomList = []
+   PopData = []
+   for line in lines:
+      l_sp = line.split()
+      if len(l_sp) == 0:
+         continue
+      elif l_sp[0] == "Atom":
+         AtomList = []
+         PopData = []
+      elif len(l_sp) == 4:
+         AtomList.append(l_sp[1])
+         PopData.append((float(l_sp[2]), 0.0))
+      elif len(l_sp) == 5:
+         AtomList.append(l_sp[1])
+         PopData.append( (float(l_sp[2]), float(l_sp[4])) )
+   return AtomList, np.array(PopData)
+
+def parse_gradient_lines(lines):
+   coord_x = []
+   coord_y = []
+   coord_z = []
+   for line in lines:
+      l_sp = line.split()
+      if len(l_sp) == 0 or l_sp[0] == "Gradient" or l_sp[0] == "Max":
+         continue
+      elif l_sp[0] == "1" and l_sp[1] != "2":
+         coord_x.extend([float(val) for val in l_sp[1:]])
+      elif l_sp[0] == "2":
+         coord_y.extend([float(val) for val in l_sp[1:]])
+      elif l_sp[0] == "3":
+         coord_z.extend([float(val) for val in l_sp[1:]])
+   return np.array(list(zip(coord_x, coord_y, coord_z)))
+
+def parse_fd_force_lines(lines):
+   forces = []
+   for line in lines:
+      l_sp = line.split()
+      if len(l_sp) == 0: continue
+      if re.match('(\d+)', l_sp[0]):
+         forces.append((float(l_sp[1]), float(l_sp[2]), float(l_sp[3])))
+   return np.array(forces)
+
+def parse_freq_lines(lines):
+   freqs = []
+   for line in lines:
+      if 'Frequency:' in line:
+         freqs.extend([float(val) for val in line.split()[1:]])
+   return np.array(freqs)
+
+def parse_ir_intens_lines(lines):
+   intens = []
+   for line in lines:
+      if 'IR Intens:' in line:
+         intens.extend([float(val) for val in line.split()[2:]])
+   return np.array(intens)
+
+#atoms and coordinates printed after the geometry optimization converged
+def parse_opt_geom_lines(lines):
+   AtomList = []
+   CoordList = []
+   for line in lines:
+      l = re.search('^\s*(\d+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s*$', line)
+      if l!=None:
+         AtomList.append(l.group(2))
+         CoordList.append((float(l.group(3)), float(l.group(4)), float(l.group(5))))
+   return AtomList, np.array(CoordList)
+
+#square matrices printed as a row of column indices followed by "i  value value ..." rows,
+#wide ones in several column blocks; a block ends at the first line of any other kind
+def parse_matrix_lines(lines):
+   matrices = []
+   rows = {}
+   columns = []
+   for line in lines + ['']:
+      l_sp = line.split()
+      if len(l_sp) > 0 and all([re.match('^\d+$', item) for item in l_sp]):
+         if int(l_sp[0]) == 1 and len(rows) > 0:
+            matrices.append(rows)
+            rows = {}
+         columns = [int(item) for item in l_sp]
+         continue
+      try:
+         irow = int(l_sp[0])
+         values = [float(item) for item in l_sp[1:]]
+      except (IndexError, ValueError):
+         values = None
+      if values != None and len(values) == len(columns) and len(columns) > 0:
+         rows.setdefault(irow, {}).update(zip(columns, values))
+         continue
+      if len(rows) > 0:
+         matrices.append(rows)
+      rows = {}
+      columns = []
+   blocks = []
+   for rows in matrices:
+      n = len(rows)
+      if sorted(rows) != list(range(1, n+1)) or any([sorted(rows[i]) != list(range(1, n+1)) for i in rows]):
+         continue
+      blocks.append(np.array([[rows[i][j] for j in range(1, n+1)] for i in range(1, n+1)]))
+   return blocks
+
+#blank lines, rows of column indices and "i  value value ..." rows
+def is_matrix_line(line):
+   l_sp = line.split()
+   if len(l_sp) == 0:
+      return True
+   try:
+      int(l_sp[0])
+      [float(item) for item in l_sp[1:]]
+   except ValueError:
+      return False
+   return True
+
+#the matrix printed right below each line containing marker (column indices first); None for a
+#matrix that can not be parsed
+def matrix_below(marker):
+   def handler(lines):
+      blocks = []
+      chunks = []
+      for line in lines:
+         if marker in line:
+            chunks.append([])
+         elif len(chunks) > 0:
+            chunks[-1].append(line)
+      for chunk in chunks:
+         chunk = [line for line in chunk if line.strip() != '']
+         if len(chunk) == 0 or not all([re.match('^\d+$', item) for item in chunk[0].split()]):
+            continue
+         blocks.append((parse_matrix_lines(chunk) + [None])[0])
+      return blocks
+   return handler
+
+def keep_lines(lines):
+   return lines
+
+#the sections we know how to parse: name -> (start, stop, handler)
+SECTIONS = {
+   "EField": (" EField ", "DONE ESP", parse_efield_lines),
+   "EField2": (" EField ", "DONE ESP", parse_efield_lines_second),
+   "TotESP": ("TotESP", "Ele EField", parse_esp_lines),
+   "Mulliken": ("Ground-State Mulliken Net", "Sum of atomic", parse_mulliken_lines),
+   "Becke": ("CDFT Becke Populations", "SCF time", parse_becke_lines),
+   "Gradient": ("Gradient of", "Max gradient", parse_gradient_lines),
+   "FDForce": ("Order 1", "Archival", parse_fd_force_lines),
+   "Frequency": ("INFRARED INTENSITIES", "STANDARD THERMODYNAMIC", parse_freq_lines),
+   "IRIntens": ("INFRARED INTENSITIES", "STANDARD THERMODYNAMIC", parse_ir_intens_lines),
+   "OptGeom": ("CONVERGED", "Z-matrix", parse_opt_geom_lines),
+   "OptGeomAdiab": ("OPTIMIZATION CONVERGED", "Z-matrix", parse_opt_geom_lines),
+   "FinalEnergy": ("Final energy is", None, keep_lines),
+   "ExcitedState": ("Excited state", 4, keep_lines),
+   "StateDipole": ("Dipole moment [D]:", 1, keep_lines),
+   "GMHTransDip": ("GMH Couplings Between Singlet Excited States", "END OF GMH CALCULATION", keep_lines),
+   "MullikenStates": ("Mulliken Net Atomic", "Sum of atomic", keep_lines),
+   "ChElPG": ("ChElPG Net Atomic", "Sum of atomic", keep_lines),
+   "ChElPG2": ("ChElPG   Net Atomic", "Sum of atomic", keep_lines),
+   "MKESP": ("Merz-Kollman ESP", "Sum of atomic", keep_lines),
+   "MKRESP": ("Merz-Kollman RESP", "Sum of atomic", keep_lines),
+   "ESPStates": ("ESP charges for", "---", keep_lines),
+   "Hirshfeld": ("Hirshfeld Atomic Charges", "Sum of atomic", keep_lines),
+   "DiabatCoupling": ("Coupling between diabats", None, keep_lines),
+   "DiabatHamiltonian": ("Hamiltonian", is_matrix_line, matrix_below("Hamiltonian")),
+   "DiabatOverlap": ("overlap", is_matrix_line, matrix_below("overlap")),
+}
+
+#read the output once and return {section_name: parsed result} for all the requested sections
+def scan_output(outfile, section_list):
+   scanner = Scanner()
+   for name in section_list:
+      if name not in SECTIONS:
+         print("Unrecognized output section: %s" %name)
+         sys.exit(1)
+      start, stop, handler = SECTIONS[name]
+      scanner.add_section(name, start, stop, handler)
+   return scanner.scan(outfile)
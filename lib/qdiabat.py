@@ -0,0 +1,86 @@
+import os, sys
+import numpy as np
+
+#Diabatic Hamiltonians of many geometries
+#The diabatic Hamiltonian H and the overlap S of the (nonorthogonal) diabats of G geometries
+#are stacked into (G, n, n) arrays and every step is one batched numpy.linalg call:
+#   Loewdin    S^(-1/2) from the eigenpairs of S; H_orth = S^(-1/2) H S^(-1/2) is the
+#              Hamiltonian over the symmetrically orthogonalized diabats
+#   adiabats   H c = E S c solved as the ordinary problem of H_orth, c = S^(-1/2) c'
+#   coupling   V_ij = (H_ij - S_ij (H_ii + H_jj)/2) / (1 - S_ij^2), the effective coupling
+#              between a pair of nonorthogonal diabats
+#Geometries whose S is not positive definite get NaN.
+
+#the matrices of one output: the last H and S printed; None if either is missing or could not
+#be parsed
+def last_matrices(hamil_blocks, overlap_blocks):
+   if len(hamil_blocks) == 0 or len(overlap_blocks) == 0:
+      return None
+   H = hamil_blocks[-1]
+   S = overlap_blocks[-1]
+   if H is None or S is None or H.shape != S.shape:
+      return None
+   return H, S
+
+#S^(-1/2) of (G, n, n) overlaps
+def inverse_sqrt(S, tol=1.0E-10):
+   w, U = np.linalg.eigh(S)
+   ok = np.all(w > tol, axis=-1)
+   w_isqrt = np.where(ok[:, np.newaxis], 1.0 / np.sqrt(np.where(w > tol, w, 1.0)), np.nan)
+   return np.einsum('gik,gk,gjk->gij', U, w_isqrt, U)
+
+def lowdin_orthogonalize(H, S):
+   X = inverse_sqrt(S)
+   return X, np.einsum('gki,gkl,glj->gij', X, H, X)
+
+#adiabatic energies (G, n) in ascending order and their coefficients over the diabats (G, n, n)
+def solve_adiabats(H, S):
+   X, H_orth = lowdin_orthogonalize(H, S)
+   E = np.full(H.shape[:2], np.nan)
+   C = np.full(H.shape, np.nan)
+   ok = ~np.isnan(H_orth).any(axis=(1, 2))
+   if np.any(ok):
+      E[ok], C_orth = np.linalg.eigh(H_orth[ok])
+      C[ok] = np.matmul(X[ok], C_orth)
+   return E, C, H_orth
+
+def effective_coupling(H, S):
+   Hii = np.diagonal(H, axis1=1, axis2=2)
+   denom = 1.0 - S**2
+   n = H.shape[1]
+   denom[:, np.arange(n), np.arange(n)] = np.nan
+   denom[denom == 0.0] = np.nan
+   V = (H - S * 0.5 * (Hii[:, :, np.newaxis] + Hii[:, np.newaxis, :])) / denom
+   V[:, np.arange(n), np.arange(n)] = 0.0
+   return V
+
+#{name: array} of the stacked H (G, n, n) and S (G, n, n)
+def diabat_curves(H, S):
+   H = np.asarray(H, dtype=float)
+   S = np.asarray(S, dtype=float)
+   E, C, H_orth = solve_adiabats(H, S)
+   return {'H': H, 'S': S, 'E_diabatic': np.diagonal(H, axis1=1, axis2=2).copy(), 'E_adiabatic': E, 'C_adiabatic': C, 'H_lowdin': H_orth, 'V_eff': effective_coupling(H, S)}
+
+#(i, j) pairs of the upper triangle, from 0
+def state_pairs(n):
+   return list(zip(*np.triu_indices(n, 1)))
+
+#one block per molecule as the other csv files: molecule name, then one row per geometry
+def write_curves_table(outfile, molnames, geom_params, curves):
+   n = curves['H'].shape[1]
+   pairs = state_pairs(n)
+   fw = open(outfile, 'w')
+   fw.write('dist,' + ','.join(['Hd%d' %(i+1) for i in range(n)] + ['E%d' %(i+1) for i in range(n)]))
+   fw.write(',' + ','.join(['H%d%d,S%d%d,Vlowdin%d%d,Veff%d%d' %((i+1, j+1)*4) for i, j in pairs]) + '\n')
+   for molname in sorted(set(molnames), key=list(molnames).index):
+      fw.write(molname+'\n')
+      for igeom in np.where(np.asarray(molnames) == molname)[0]:
+         values = list(curves['E_diabatic'][igeom]) + list(curves['E_adiabatic'][igeom])
+         fw.write('%.2f,' %geom_params[igeom] + ','.join(['%.8f' %value for value in values]))
+         for i, j in pairs:
+            fw.write(',%.6e,%.6e,%.6e,%.6e' %(curves['H'][igeom, i, j], curves['S'][igeom, i, j], curves['H_lowdin'][igeom, i, j], curves['V_eff'][igeom, i, j]))
+         fw.write('\n')
+   fw.close()
+
+def write_curves_arrays(npzfile, molnames, geom_params, curves):
+   np.savez_compressed(npzfile, molname=np.array(molnames), geom_param=np.array(geom_params), **curves)
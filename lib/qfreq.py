@@ -0,0 +1,111 @@
+import os, sys
+import numpy as np
+
+#Harmonic analysis of Hessians assembled from finite-difference segments
+#A segment job (FD2ND_BLOCK_INDEX = iseg, FD2ND_BLOCK_SIZE = size) displaces the atoms
+#[iseg*size, (iseg+1)*size) and prints the "Hessian of the SCF Energy" with the columns of
+#these atoms filled in. The columns of all the segments are gathered into one Hessian,
+#which is symmetrized and diagonalized here instead of in a separate wrap-up job.
+
+#average atomic masses (amu)
+ATOMIC_MASS = {
+   'H': 1.00794, 'He': 4.002602, 'Li': 6.941, 'Be': 9.012182, 'B': 10.811, 'C': 12.0107,
+   'N': 14.0067, 'O': 15.9994, 'F': 18.9984032, 'Ne': 20.1797, 'Na': 22.98976928,
+   'Mg': 24.305, 'Al': 26.9815386, 'Si': 28.0855, 'P': 30.973762, 'S': 32.065, 'Cl': 35.453,
+   'Ar': 39.948, 'K': 39.0983, 'Ca': 40.078, 'Sc': 44.955912, 'Ti': 47.867, 'V': 50.9415,
+   'Cr': 51.9961, 'Mn': 54.938045, 'Fe': 55.845, 'Co': 58.933195, 'Ni': 58.6934,
+   'Cu': 63.546, 'Zn': 65.38, 'Ga': 69.723, 'Ge': 72.64, 'As': 74.9216, 'Se': 78.96,
+   'Br': 79.904, 'Kr': 83.798, 'Rb': 85.4678, 'Sr': 87.62, 'Ag': 107.8682, 'Cd': 112.411,
+   'Sn': 118.71, 'Sb': 121.76, 'I': 126.90447, 'Xe': 131.293, 'Cs': 132.9054519,
+   'Pt': 195.084, 'Au': 196.966569, 'Hg': 200.59, 'Pb': 207.2,
+}
+
+ANGS_TO_BOHR = 1.0 / 0.529177210903
+#sqrt(Hartree / (bohr^2 amu)) in cm-1
+AU_TO_WAVENUMBER = 5140.4871
+
+HESSIAN_FLAG = "Hessian of the SCF Energy"
+
+#the last Hessian printed in the output (Hartree/bohr^2), None if there is none
+def read_hessian(outfile, ndim):
+   hessian = None
+   fr = open(outfile, 'r', errors='replace')
+   line = fr.readline()
+   while line != '':
+      if HESSIAN_FLAG not in line:
+         line = fr.readline()
+         continue
+      hessian = np.zeros((ndim, ndim))
+      cols = None
+      line = fr.readline()
+      while line != '':
+         l_sp = line.split()
+         if len(l_sp) == 0 or not l_sp[0].isdigit():
+            break
+         if all(val.isdigit() for val in l_sp):
+            cols = [int(val)-1 for val in l_sp]
+         elif cols != None and len(l_sp) == len(cols)+1:
+            hessian[int(l_sp[0])-1, cols] = [float(val) for val in l_sp[1:]]
+         else:
+            break
+         line = fr.readline()
+   fr.close()
+   return hessian
+
+#Cartesian components (0-based) displaced by segment iseg
+def segment_columns(iseg, seg_size, natoms):
+   first = iseg * seg_size
+   last = min(natoms, first + seg_size)
+   return np.arange(3*first, 3*last)
+
+#seg_outputs: {iseg: outfile}; returns the symmetrized Hessian and the segments without a Hessian
+def assemble_hessian(seg_outputs, seg_size, natoms):
+   ndim = 3 * natoms
+   hessian = np.zeros((ndim, ndim))
+   missing = []
+   for iseg in sorted(seg_outputs):
+      block = read_hessian(seg_outputs[iseg], ndim)
+      if block is None:
+         missing.append(iseg)
+         continue
+      cols = segment_columns(iseg, seg_size, natoms)
+      hessian[:,cols] = block[:,cols]
+   return 0.5 * (hessian + hessian.T), missing
+
+#mass-weighted translations and rotations, orthonormalized (5 for a linear molecule)
+def rigid_body_modes(masses, coords_bohr):
+   sqrt_m = np.sqrt(masses)
+   com = (masses[:,None] * coords_bohr).sum(axis=0) / masses.sum()
+   rel = coords_bohr - com
+   natoms = len(masses)
+   vecs = np.zeros((6, natoms, 3))
+   for k in range(3):
+      vecs[k,:,k] = sqrt_m
+      axis = np.zeros(3)
+      axis[k] = 1.0
+      vecs[3+k] = sqrt_m[:,None] * np.cross(axis, rel)
+   u, s, vt = np.linalg.svd(vecs.reshape(6, -1).T, full_matrices=False)
+   return u[:, s > 1e-6 * s[0]]
+
+#harmonic frequencies (cm-1, imaginary ones negative) and mass-weighted normal modes
+def harmonic_frequencies(hessian, elements, coords_angs, project=True):
+   for elem in elements:
+      if elem not in ATOMIC_MASS:
+         print("No atomic mass for element %s" %elem)
+         sys.exit(1)
+   masses = np.array([ATOMIC_MASS[elem] for elem in elements])
+   inv_sqrt_m = np.repeat(1.0/np.sqrt(masses), 3)
+   hess_mw = hessian * inv_sqrt_m[:,None] * inv_sqrt_m[None,:]
+   nrigid = 0
+   if project:
+      rigid = rigid_body_modes(masses, np.asarray(coords_angs) * ANGS_TO_BOHR)
+      nrigid = rigid.shape[1]
+      proj = np.eye(len(inv_sqrt_m)) - rigid.dot(rigid.T)
+      hess_mw = proj.dot(hess_mw).dot(proj)
+   evals, evecs = np.linalg.eigh(hess_mw)
+   if nrigid > 0:
+      #the projected rigid-body modes are the ones closest to zero
+      keep = np.sort(np.argsort(np.abs(evals))[nrigid:])
+      evals, evecs = evals[keep], evecs[:,keep]
+   freqs = np.sign(evals) * np.sqrt(np.abs(evals)) * AU_TO_WAVENUMBER
+   return freqs, evecs
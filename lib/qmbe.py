@@ -0,0 +1,132 @@
+import os, re, sys, itertools
+import numpy as np
+
+#Many-body expansion (MBE) over the fragments of a cluster
+#A subsystem is a sorted tuple of fragment indices (from 0). The interaction energy of a
+#subsystem (any EDA term of its job; zero for a monomer) is expanded as
+#   E(S) = sum over T in S with |T| >= 2 of D(T)
+#so the k-body contribution of S is D(S) = E(S) - sum of D(T) over its proper subsets T.
+#The contributions are evaluated order by order for all the k-mers of that order at once,
+#looking the subsets up among the sorted bit masks of the subsystems. Subsystems that were
+#not computed (screened out by distance) contribute nothing.
+#Subsystem jobs are named by the fragment numbers (from 1): "mbe12" with fewer than 10
+#fragments, "mbe1-12" otherwise.
+
+LABEL_PATTERN = re.compile('_(mbe[0-9-]+)_')
+
+def subsystem_label(subsystem, nfrgm):
+   sep = '' if nfrgm < 10 else '-'
+   return 'mbe' + sep.join([str(ifrgm+1) for ifrgm in subsystem])
+
+def parse_subsystem_label(label):
+   body = label[3:]
+   if '-' in body:
+      return tuple([int(i)-1 for i in body.split('-')])
+   return tuple([int(i)-1 for i in body])
+
+#the subsystem label in the name of an output, None for the supersystem job
+def label_in_name(outname):
+   l = LABEL_PATTERN.search(outname)
+   if l == None:
+      return None
+   return l.group(1)
+
+#shortest interatomic distance between every two fragments; bounds as in qmol.FRGM
+def fragment_distances(Coords, bounds):
+   Coords = np.asarray(Coords, dtype=float)
+   dist = np.linalg.norm(Coords[:, None, :] - Coords[None, :, :], axis=-1)
+   starts = np.asarray(bounds[:-1], dtype=int)
+   return np.minimum.reduceat(np.minimum.reduceat(dist, starts, axis=0), starts, axis=1)
+
+#all the k-mers with 2 <= k <= order, in the order of k and then lexicographically
+#with a cutoff, only the k-mers whose fragments are all within cutoff of each other are kept
+def enumerate_subsystems(nfrgm, order, frgm_dist=None, cutoff=None):
+   near = np.ones((nfrgm, nfrgm), dtype=bool)
+   if cutoff != None:
+      near = np.asarray(frgm_dist) <= cutoff
+   above = np.arange(nfrgm)[None, :] > np.arange(nfrgm)[:, None]
+   current = np.arange(nfrgm)[:, None]
+   subsystems = []
+   for k in range(2, min(order, nfrgm) + 1):
+      #extend every (k-1)-mer by a fragment of higher index close to all of its members
+      grow = np.all(near[current], axis=1) & above[current[:, -1]]
+      rows, new = np.nonzero(grow)
+      current = np.hstack((current[rows], new[:, None]))
+      subsystems += [tuple(row) for row in current.tolist()]
+   return subsystems
+
+#geometrically equivalent subsystems (same fragment charges/multiplicities, elements and
+#sorted interatomic distances up to "decimals") share one representative
+def subsystem_fingerprint(elements, Coords, bounds, subsystem, frgm_states=None, decimals=3):
+   atoms = np.concatenate([np.arange(bounds[ifrgm], bounds[ifrgm+1]) for ifrgm in subsystem])
+   sub = np.asarray(Coords, dtype=float)[atoms]
+   iu = np.triu_indices(len(atoms), 1)
+   dist = np.linalg.norm(sub[iu[0]] - sub[iu[1]], axis=-1)
+   states = ()
+   if frgm_states != None:
+      states = tuple(sorted([frgm_states[ifrgm] for ifrgm in subsystem]))
+   return (states, tuple(sorted(np.asarray(elements)[atoms].tolist())), tuple(np.round(np.sort(dist), decimals).tolist()))
+
+#the index (in subsystems) of the representative of every subsystem
+def equivalent_subsystems(elements, Coords, bounds, subsystems, frgm_states=None, decimals=3):
+   first = {}
+   representative = []
+   for isub, subsystem in enumerate(subsystems):
+      key = (len(subsystem), subsystem_fingerprint(elements, Coords, bounds, subsystem, frgm_states, decimals))
+      representative.append(first.setdefault(key, isub))
+   return representative
+
+#label,representative,n_frgm for every enumerated subsystem; the number of fragments of the
+#supersystem cannot be told from the labels once subsystems are screened out by distance
+def write_manifest(mbe_file, labels, representative, nfrgm):
+   fw = open(mbe_file, 'w')
+   fw.write('label,representative,n_frgm\n')
+   fw.write(''.join(['%s,%s,%d\n' %(label, labels[irep], nfrgm) for label, irep in zip(labels, representative)]))
+   fw.close()
+
+#the number of fragments (None for a manifest without it) and {label: representative label}
+def read_manifest(mbe_file):
+   nfrgm = None
+   equiv = {}
+   fr = open(mbe_file, 'r')
+   fr.readline()
+   for line in fr:
+      l_sp = line.strip().split(',')
+      if len(l_sp) >= 2:
+         equiv[l_sp[0]] = l_sp[1]
+      if len(l_sp) == 3:
+         nfrgm = int(l_sp[2])
+   fr.close()
+   return nfrgm, equiv
+
+def subsystem_masks(subsystems):
+   return np.array([sum([1 << ifrgm for ifrgm in subsystem]) for subsystem in subsystems], dtype=np.int64)
+
+#k-body contributions D (M, nterm) from the subsystem energies (M, nterm)
+def nbody_contributions(subsystems, energies):
+   delta = np.array(energies, dtype=float).reshape(len(subsystems), -1)
+   if len(subsystems) == 0:
+      return delta
+   if max([max(subsystem) for subsystem in subsystems]) > 62:
+      print("At most 63 fragments are supported in the many-body expansion")
+      sys.exit(1)
+   masks = subsystem_masks(subsystems)
+   sort_idx = np.argsort(masks)
+   sorted_masks = masks[sort_idx]
+   sizes = np.array([len(subsystem) for subsystem in subsystems])
+   for k in np.unique(sizes):
+      rows = np.flatnonzero(sizes == k)
+      bits = np.left_shift(np.int64(1), np.array([subsystems[row] for row in rows], dtype=np.int64))
+      #the subsets of all the k-mers taken from the same k-mer positions at once
+      for j in range(2, k):
+         for pos in itertools.combinations(range(k), j):
+            sub_masks = bits[:, list(pos)].sum(axis=1)
+            loc = np.minimum(np.searchsorted(sorted_masks, sub_masks), len(sorted_masks)-1)
+            found = sorted_masks[loc] == sub_masks
+            delta[rows[found]] -= delta[sort_idx[loc[found]]]
+   return delta
+
+#{k: (number of k-mers, sum of their contributions)}
+def nbody_sums(subsystems, delta):
+   sizes = np.array([len(subsystem) for subsystem in subsystems])
+   return dict([(int(k), (int(np.sum(sizes == k)), delta[sizes == k].sum(axis=0))) for k in np.unique(sizes)])
@@ -1,29 +1,94 @@
 import os, glob, re, sys
 import subprocess as sp
 import numpy as np
+import qtime
 
-class XYZ:  #class for XYZ coordinates
+#one "$molecule" line; ghost atoms get an "@" in front of the symbol
+MOL_LINE = "%-4s %-10.5f %-10.5f %-10.5f\n"
+
+class Molecule:  #atoms stored as an element array and an (N,3) coordinate array
+   __slots__ = ('Name', 'elements', '_coords', '_lines')
+
+   def __init__(self, elements, coords, Name=''):
+      self.Name = Name
+      self.elements = np.asarray(elements, dtype=str)
+      self.coords = coords
+
+   @property
+   def NAtom(self):
+      return len(self.elements)
+
+   #assigning new coordinates drops the cached atom lines
+   @property
+   def coords(self):
+      return self._coords
+
+   @coords.setter
+   def coords(self, coords):
+      self._coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+      self._lines = None
+
+   def set_coords(self, coords):
+      self.coords = coords
+
+   #the formatted atom lines, rendered with one formatting call and kept until the
+   #coordinates are assigned again
+   def atom_lines(self):
+      if self._lines == None:
+         table = np.empty((self.NAtom, 4), dtype=object)
+         table[:, 0] = self.elements
+         table[:, 1:] = self.coords
+         self._lines = ((MOL_LINE * self.NAtom) %tuple(table.ravel())).splitlines(True)
+      return self._lines
+
+   #atoms [index_start, index_end) as text; with ghost=True the other atoms are added as ghosts
+   def atom_text(self, index_start=0, index_end=None, ghost=False):
+      lines = self.atom_lines()
+      if index_end == None:
+         index_end = self.NAtom
+      if not ghost:
+         return ''.join(lines[index_start:index_end])
+      text = ''.join(['@'+line for line in lines[:index_start]])
+      text += ''.join(lines[index_start:index_end])
+      return text + ''.join(['@'+line for line in lines[index_end:]])
+
+class XYZ(Molecule):  #class for XYZ coordinates
+   __slots__ = ()
+
+   @qtime.timed()
    def __init__(self, xyz_file):
       #print (xyz_file)
-      self.Name = re.search("([^/]+).xyz$", xyz_file).group(1)
+      Name = re.search("([^/]+).xyz$", xyz_file).group(1)
       f = open(xyz_file, 'r')
-      self.AtomList = []
-      self.CoordList = []
-      for line in f.readlines():
+      AtomList = []
+      CoordList = []
+      NAtom = -1
+      for line in f:
          l = re.search('^\s*(\d+)\s*$', line)
          if l!=None:
-            self.NAtom = int(l.group(1))
+            NAtom = int(l.group(1))
          l = re.search('^\s*(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s*$', line)
          if l!=None:
-            self.AtomList.append(l.group(1))
-            coord = float(l.group(2)), float(l.group(3)), float(l.group(4))
-            self.CoordList.append(coord)
+            AtomList.append(l.group(1))
+            CoordList.append((float(l.group(2)), float(l.group(3)), float(l.group(4))))
+      f.close()
 
-      if(len(self.AtomList)!=self.NAtom):
-         print("Error in number of atoms: "+xyzfile)
+      if(len(AtomList)!=NAtom):
+         print("Error in number of atoms: "+xyz_file)
          sys.exit(1)
+      Molecule.__init__(self, AtomList, CoordList, Name)
+
+   #the names used before the array storage
+   @property
+   def AtomList(self):
+      return self.elements
+
+   @property
+   def CoordList(self):
+      return self.coords
 
 class FRGM: #class for fragment partition information
+   @qtime.timed()
    def __init__(self, frgm_file):
       fr = open(frgm_file, 'r')
       line = fr.readline()
@@ -64,74 +129,38 @@ class FRGM: #class for fragment partition information
             print("skip the unexpected lines in " + frgm_file) 
          line = fr.readline()
 
-      self.atoms_offset = np.zeros(self.n_frgm, dtype=int)
-      offset = 0
-      for index in range(0, self.n_frgm):
-         self.atoms_offset[index] = offset
-         offset += self.natoms_frgm[index] 
+      fr.close()
+      #fragment ifrgm spans atoms [bounds[ifrgm], bounds[ifrgm+1])
+      self.bounds = np.concatenate(([0], np.cumsum(self.natoms_frgm))).astype(int)
+      self.atoms_offset = self.bounds[:-1]
 
 def WriteMolecule(fw, XYZ, charge, mult):
-   fw.write('$molecule\n')
-   #total charge and mult
-   fw.write("%d %d\n" %(charge, mult))
-   for iatom in range(0, XYZ.NAtom):
-      atomic_symbol = XYZ.AtomList[iatom]
-      x, y, z = XYZ.CoordList[iatom]
-      fw.write("%-4s %-10.5f %-10.5f %-10.5f\n" %(atomic_symbol, x, y, z))
-   fw.write('$end\n')
-   fw.write('\n')
+   fw.write('$molecule\n' + "%d %d\n" %(charge, mult) + XYZ.atom_text() + '$end\n\n')
 
 def WriteMolecule_Frgm(fw, XYZ, FRGM):
    #print "Working on "+XYZ.Name
-   fw.write('$molecule\n')
    #total charge and mult
-   fw.write("%d %d\n" %(FRGM.total_charge, FRGM.total_mult))
+   text = ['$molecule\n', "%d %d\n" %(FRGM.total_charge, FRGM.total_mult)]
    #loop over fragments
    for ifrgm in range(0, FRGM.n_frgm):
-      fw.write('--\n')
-      fw.write("%d %d\n" %(FRGM.charge_frgm[ifrgm], FRGM.mult_frgm[ifrgm]))
-      natom_frgm = FRGM.natoms_frgm[ifrgm]
-      index_start = FRGM.atoms_offset[ifrgm]
-      for iatom in range(index_start, index_start+natom_frgm):
-         atomic_symbol = XYZ.AtomList[iatom]
-         x, y, z = XYZ.CoordList[iatom]
-         fw.write("%-4s %-10.5f %-10.5f %-10.5f\n" %(atomic_symbol, x, y, z))
-   fw.write('$end\n')
-   fw.write('\n')
+      text.append('--\n')
+      text.append("%d %d\n" %(FRGM.charge_frgm[ifrgm], FRGM.mult_frgm[ifrgm]))
+      text.append(XYZ.atom_text(FRGM.bounds[ifrgm], FRGM.bounds[ifrgm+1]))
+   text.append('$end\n\n')
+   fw.write(''.join(text))
 
 def WriteMolecule_supersub(fw, XYZ, FRGM, monomer=0, ghost=False):
-   fw.write('$molecule\n')
    if monomer == 0:   #supersystem
       if ghost:
          print("Can't add ghost atoms for the supersystem calculation")
          sys.exit(0)
       else:
-         fw.write("%d %d\n" %(FRGM.total_charge, FRGM.total_mult))
-         for index in range(0, XYZ.NAtom):
-            atomic_symbol = XYZ.AtomList[index]
-            x, y, z = XYZ.CoordList[index]
-            fw.write("%-4s %-10.5f %-10.5f %-10.5f\n" %(atomic_symbol, x, y, z)) 
-   else:   #monomer job
+         text = "%d %d\n" %(FRGM.total_charge, FRGM.total_mult) + XYZ.atom_text()
+   else:   #monomer job; with ghost, the other fragments are added as ghost atoms
       index_frgm = monomer - 1   #start from zero
-      index_start = FRGM.atoms_offset[index_frgm]
-      index_end = index_start+FRGM.natoms_frgm[index_frgm]
-      fw.write("%d %d\n" %(FRGM.charge_frgm[index_frgm], FRGM.mult_frgm[index_frgm]))
-      if not ghost:   #isolated monomer
-         for index in range(index_start, index_end):
-            atomic_symbol = XYZ.AtomList[index]
-            x, y, z = XYZ.CoordList[index]
-            fw.write("%-4s %-10.5f %-10.5f %-10.5f\n" %(atomic_symbol, x, y, z)) 
-
-      else:  #monomer with ghost
-         for index in range(0, XYZ.NAtom):
-            atomic_symbol = XYZ.AtomList[index]
-            x, y, z = XYZ.CoordList[index]
-            if index in range(index_start, index_end):
-               fw.write("%-4s %-10.5f %-10.5f %-10.5f\n" %(atomic_symbol, x, y, z)) 
-            else:  #ghost atoms
-               fw.write("@%-4s %-10.5f %-10.5f %-10.5f\n" %(atomic_symbol, x, y, z)) 
-   fw.write("$end\n")
-   fw.write("\n")
+      text = "%d %d\n" %(FRGM.charge_frgm[index_frgm], FRGM.mult_frgm[index_frgm])
+      text += XYZ.atom_text(FRGM.bounds[index_frgm], FRGM.bounds[index_frgm+1], ghost)
+   fw.write('$molecule\n' + text + "$end\n\n")
 
 
 def WriteMolecule_Read(fw):
@@ -146,21 +175,20 @@ def detect_unrestricted_frgm(FRGM):
             break
     return False
 
+@qtime.timed()
 def ParseMolFile(MoleculeFile):
    MOLECULE = {}
    MOLECULE["name"] = re.search('([^\/]+).mol', MoleculeFile).group(1)
    MOLECULE["nlines"] = 0
-   curline = 0
-   MOLECULE["the_line"] = {}
+   MOLECULE["lines"] = []
    MOLECULE["unrestricted"] = False
    MOLECULE["fragmented"] = False
    f = open(MoleculeFile,'r')
    line = f.readline()
    mult_checked = False
    while line!='':
-      MOLECULE["the_line"][str(curline)] = line
-      curline += 1
-      MOLECULE["nlines"] = curline
+      MOLECULE["lines"].append(line)
+      MOLECULE["nlines"] = len(MOLECULE["lines"])
       l=re.search("^\s*(\S+)\s+(\S+)\s*$",line) #charge and mult
       if (l!=None and not mult_checked):
          if (int(l.group(2)) != 1):	#multiplicity larger than 1
@@ -174,10 +202,5 @@ def ParseMolFile(MoleculeFile):
    return MOLECULE
 				
 def WriteMolSection(fw, MyMOLECULE):
-   fw.write('$molecule\n')
-   for line in range(MyMOLECULE["nlines"]):
-      fw.write(MyMOLECULE["the_line"][str(line)])
-   fw.write('\n')
-   fw.write('$end\n')
-   fw.write('\n')
+   fw.write('$molecule\n' + ''.join(MyMOLECULE["lines"]) + '\n$end\n\n')
    return
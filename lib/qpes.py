@@ -0,0 +1,139 @@
+import os, sys, itertools
+import numpy as np
+
+#Geometries of PES scans on a grid of coordinates
+#A scan coordinate moves a set of atoms (one atom or a whole fragment) of every geometry of a
+#stack (M, natoms, 3) for all its K values at once, giving (M, K, natoms, 3):
+#   dist      distance atom1...atom2 set to the value, atom1's fragment translated along atom2->atom1
+#   dist_pct  the same distance set to the value times the current one
+#   dist_log  the distance set to 10^value
+#   bond      atom2 moved away from atom1 along the bond by the value (displacement)
+#   bond_abs  bond atom1-atom2 set to the value by moving atom2
+#   angle     angle atom1-atom2-atom3 set to the value (degree), atom3 rotated about atom2 in
+#             the plane of the three atoms
+#The coordinates of a grid are applied one after the other, each to all the geometries made by
+#the previous ones, so the (npoints, natoms, 3) stack of a 2-D/3-D grid takes one broadcasted
+#operation per coordinate, with the points in the order of numpy.meshgrid(..., indexing='ij').
+#A coordinate is given as "kind:atoms:start:end:increment[:atom|frgm]", e.g. dist:1,4:2.5:6:0.1
+
+SCAN_KINDS = ['dist', 'dist_pct', 'dist_log', 'bond', 'bond_abs', 'angle']
+#the piece of the file name for each value
+TAG_FORMAT = {'dist': 'dist_%.2f', 'dist_pct': 'rel_dist_%.2f', 'dist_log': 'logdist_%.2f', 'bond': 'bond_%.4f', 'bond_abs': 'bond_%.4f', 'angle': 'angle_%.2f'}
+NATOMS_KIND = {'dist': 2, 'dist_pct': 2, 'dist_log': 2, 'bond': 2, 'bond_abs': 2, 'angle': 3}
+#atoms moved by default: the fragment of atom1 for the distances, the last atom otherwise
+MOVE_DEFAULT = {'dist': 'frgm', 'dist_pct': 'frgm', 'dist_log': 'frgm', 'bond': 'atom', 'bond_abs': 'atom', 'angle': 'atom'}
+
+#start, start+increment, ... up to end (included within a small fraction of the increment)
+def scan_values(start, end, increment, tol=1.0E-3):
+   npoints = int(np.floor((end - start) / increment + tol)) + 1
+   return start + increment * np.arange(max(npoints, 0))
+
+class ScanCoord:
+   #atoms: indices from 1; moving: boolean mask over all the atoms
+   def __init__(self, kind, atoms, values, moving):
+      if kind not in SCAN_KINDS:
+         print("Unsupported scan coordinate: %s (available: %s)" %(kind, ', '.join(SCAN_KINDS)))
+         sys.exit(1)
+      if len(atoms) != NATOMS_KIND[kind]:
+         print("The %s coordinate needs %d atoms" %(kind, NATOMS_KIND[kind]))
+         sys.exit(1)
+      self.kind = kind
+      self.atoms = np.array(atoms, dtype=int) - 1
+      self.values = np.asarray(values, dtype=float)
+      self.moving = np.asarray(moving, dtype=bool)
+
+   def tags(self):
+      return [TAG_FORMAT[self.kind] %value for value in self.values]
+
+   #Stack (M, natoms, 3) -> (M, K, natoms, 3)
+   def apply(self, Stack):
+      if self.kind == 'angle':
+         moved = self.rotate(Stack)
+      else:
+         moved = Stack[:, np.newaxis] + self.translation(Stack)[:, :, np.newaxis, :]
+      return np.where(self.moving[np.newaxis, np.newaxis, :, np.newaxis], moved, Stack[:, np.newaxis])
+
+   #(M, K, 3) shifts of the moving atoms
+   def translation(self, Stack):
+      a1, a2 = self.atoms
+      if self.kind in ['bond', 'bond_abs']:
+         vec = Stack[:, a2] - Stack[:, a1]
+      else:
+         vec = Stack[:, a1] - Stack[:, a2]
+      length = np.linalg.norm(vec, axis=-1)[:, np.newaxis]
+      unit = (vec / length)[:, np.newaxis, :]
+      values = self.values[np.newaxis, :]
+      if self.kind == 'dist_pct':
+         return vec[:, np.newaxis, :] * (values - 1.0)[..., np.newaxis]
+      if self.kind == 'bond':
+         return unit * values[..., np.newaxis]
+      if self.kind == 'dist_log':
+         values = 10.0 ** values
+      return unit * (values - length)[..., np.newaxis]
+
+   #Rodrigues rotation of the moving atoms about the normal of the atom1-atom2-atom3 plane at atom2
+   def rotate(self, Stack):
+      a1, a2, a3 = self.atoms
+      r1 = Stack[:, a1] - Stack[:, a2]
+      r3 = Stack[:, a3] - Stack[:, a2]
+      normal = np.cross(r1, r3)
+      norm = np.linalg.norm(normal, axis=-1)
+      if np.any(norm < 1.0E-8 * np.linalg.norm(r1, axis=-1) * np.linalg.norm(r3, axis=-1)):
+         print("The angle %d-%d-%d is linear: the rotation plane is not defined" %(a1+1, a2+1, a3+1))
+         sys.exit(1)
+      n = (normal / norm[:, np.newaxis])[:, np.newaxis, np.newaxis, :]
+      theta0 = np.arccos(np.clip(np.sum(r1*r3, axis=-1) / (np.linalg.norm(r1, axis=-1) * np.linalg.norm(r3, axis=-1)), -1.0, 1.0))
+      phi = np.radians(self.values)[np.newaxis, :] - theta0[:, np.newaxis]
+      cos_phi = np.cos(phi)[..., np.newaxis, np.newaxis]
+      sin_phi = np.sin(phi)[..., np.newaxis, np.newaxis]
+      pivot = Stack[:, a2][:, np.newaxis, np.newaxis, :]
+      rel = (Stack[:, np.newaxis] - pivot)
+      rotated = rel * cos_phi + np.cross(n, rel) * sin_phi + n * np.sum(n * rel, axis=-1, keepdims=True) * (1.0 - cos_phi)
+      return pivot + rotated
+
+#fragment (from 0) of every atom; bounds as in qmol.FRGM
+def atom_fragments(bounds, natoms):
+   return np.searchsorted(np.asarray(bounds), np.arange(natoms), side='right') - 1
+
+#mask of the atoms moved: the last atom of the coordinate ("atom") or the fragment of its
+#moving atom ("frgm": atom1 for the distances, the last atom otherwise)
+def moving_mask(kind, atoms, natoms, move, FRGM=None):
+   mask = np.zeros(natoms, dtype=bool)
+   if move == 'atom':
+      mask[atoms[-1]-1] = True
+      return mask
+   if FRGM == None:
+      print("A fragment file is needed to move the whole fragment in a %s scan" %kind)
+      sys.exit(1)
+   frgm_of_atom = atom_fragments(FRGM.bounds, natoms)
+   anchor = atoms[0] if kind in ['dist', 'dist_pct', 'dist_log'] else atoms[-1]
+   return frgm_of_atom == frgm_of_atom[anchor-1]
+
+#"kind:atoms:start:end:increment[:atom|frgm]"
+def parse_scan_coord(spec, natoms, FRGM=None):
+   l_sp = spec.split(':')
+   if len(l_sp) not in [5, 6]:
+      print("Scan coordinate %s: expected kind:atoms:start:end:increment[:atom|frgm]" %spec)
+      sys.exit(1)
+   kind = l_sp[0].lower()
+   if kind not in SCAN_KINDS:
+      print("Unsupported scan coordinate: %s (available: %s)" %(kind, ', '.join(SCAN_KINDS)))
+      sys.exit(1)
+   atoms = [int(idx) for idx in l_sp[1].split(',')]
+   values = scan_values(float(l_sp[2]), float(l_sp[3]), float(l_sp[4]))
+   move = l_sp[5] if len(l_sp) == 6 else MOVE_DEFAULT[kind]
+   return ScanCoord(kind, atoms, values, moving_mask(kind, atoms, natoms, move, FRGM))
+
+#stack (npoints, natoms, 3) of the grid over coord_list and the name tag of every point
+def scan_grid(Coords, coord_list):
+   Coords = np.asarray(Coords, dtype=float)
+   Stack = Coords[np.newaxis]
+   for coord in coord_list:
+      Stack = coord.apply(Stack).reshape(-1, Coords.shape[0], 3)
+   tags = ['_'.join(point) for point in itertools.product(*[coord.tags() for coord in coord_list])]
+   return Stack, tags
+
+#the grid values (npoints, ncoord), in the order of the stack
+def grid_values(coord_list):
+   grids = np.meshgrid(*[coord.values for coord in coord_list], indexing='ij')
+   return np.column_stack([grid.ravel() for grid in grids])
@@ -1,90 +1,130 @@
 import os, glob, re, sys
+from collections import OrderedDict
 import subprocess as sp
 import numpy as np
+import qtime
 
-def ParseRems(RemFile, do_rem_frgm=False):
-   f = open(RemFile,'r')
-   REMS = {}
-   REMS["name"] = RemFile[4:]
-   REMS["nrems"] = 0
-   currem = 0
-   REMS["the_rem"] = {}
+#Rem templates
+#A rem section is a RemSet: an ordered dictionary NAME -> VALUE (both upper case) in the order
+#the rems are first set, so that a rem is found and modified without scanning the list.
+#copy() shares the dictionary with the template until one of the two is modified, which
+#makes a fresh copy of the template for every input cheap. A parsed rem file (Rem) holds the
+#$rem section and, if requested, the $rem_frgm section. load_rems keeps the most recently
+#used rem files, keyed by path and mtime, so each file is parsed once per run.
+#ParseRems/ModRem/ModRem_Frgm/AppendRem/AppendRemFrgm work on these objects as before.
+REM_CACHE_SIZE = 64
+
+class RemSet:
+   def __init__(self, pairs=()):
+      self._rems = OrderedDict()
+      self._shared = False
+      for name, value in pairs:
+         self.set(name, value)
+
+   def __len__(self):
+      return len(self._rems)
+
+   def __contains__(self, name):
+      return name.upper() in self._rems
+
+   def items(self):
+      return self._rems.items()
+
+   def get(self, name, default=None):
+      return self._rems.get(name.upper(), default)
+
+   def set(self, name, value):
+      if self._shared:
+         self._rems = OrderedDict(self._rems)
+         self._shared = False
+      self._rems[name.upper()] = value.upper()
+
+   def copy(self):
+      clone = RemSet()
+      clone._rems = self._rems
+      clone._shared = True
+      self._shared = True
+      return clone
+
+   def text(self, section='rem'):
+      return '$' + section + '\n' + ''.join([name + '  ' + value + '\n' for name, value in self._rems.items()]) + '$end\n'
+
+class Rem:
+   def __init__(self, name='', rems=None, rem_frgm=None):
+      self.name = name
+      self.rems = rems if rems != None else RemSet()
+      self.rem_frgm = rem_frgm
+
+   def get(self, name, default=None):
+      return self.rems.get(name, default)
+
+   def set(self, name, value):
+      self.rems.set(name, value)
+
+   def set_frgm(self, name, value):
+      if self.rem_frgm == None:
+         self.rem_frgm = RemSet()
+      self.rem_frgm.set(name, value)
+
+   def copy(self):
+      return Rem(self.name, self.rems.copy(), self.rem_frgm.copy() if self.rem_frgm != None else None)
+
+   #copy.deepcopy of a template is as cheap as copy()
+   def __deepcopy__(self, memo):
+      return self.copy()
+
+   def text(self):
+      return self.rems.text('rem')
+
+   def frgm_text(self):
+      return '\n' + (self.rem_frgm if self.rem_frgm != None else RemSet()).text('rem_frgm')
+
+#name/value pairs up to the closing "$end" of the section
+def parse_rem_section(f):
+   pairs = []
    line = f.readline()
-   while not re.search('end', line):
+   while line != '' and not re.search('end', line):
       l=re.search("(\S+)\s+(\S+)",line) #rem and value
       if (not l==None):
-         REMS["the_rem"][str(currem)] = {}
-         REMS["the_rem"][str(currem)]["name"] = l.group(1).upper()
-         REMS["the_rem"][str(currem)]["value"] = l.group(2).upper()
-         currem += 1
-         REMS["nrems"] = currem
+         pairs.append((l.group(1), l.group(2)))
       line = f.readline()
+   return RemSet(pairs)
+
+@qtime.timed()
+def ParseRems(RemFile, do_rem_frgm=False):
+   f = open(RemFile,'r')
+   REMS = Rem(RemFile[4:])
+   REMS.rems = parse_rem_section(f)
    if do_rem_frgm:
       #then, parse the rem_frgm section
-      currem_frgm = 0
-      REMS["nrems_frgm"] = 0
-      REMS["rem_frgm"] = {}
-      line = f.readline()
-      while not re.search('end',line):
-         l=re.search("(\S+)\s+(\S+)",line) #rem and value
-         if (not l==None):
-            REMS["rem_frgm"][str(currem_frgm)] = {}
-            REMS["rem_frgm"][str(currem_frgm)]["name"] = l.group(1).upper()
-            REMS["rem_frgm"][str(currem_frgm)]["value"] = l.group(2).upper()
-            currem_frgm += 1
-            REMS["nrems_frgm"] = currem_frgm
-         line = f.readline()
+      REMS.rem_frgm = parse_rem_section(f)
    f.close()
    return REMS
 
+_rem_cache = OrderedDict()
+
+#a copy of the parsed rem file, which the caller is free to modify
+def load_rems(RemFile, do_rem_frgm=False):
+   key = (os.path.abspath(RemFile), os.stat(RemFile).st_mtime_ns, do_rem_frgm)
+   if key in _rem_cache:
+      _rem_cache.move_to_end(key)
+   else:
+      _rem_cache[key] = ParseRems(RemFile, do_rem_frgm)
+      if len(_rem_cache) > REM_CACHE_SIZE:
+         _rem_cache.popitem(last=False)
+   return _rem_cache[key].copy()
+
 def ModRem(r_name,r_value,MyREMS):
-	#see if the rem is already set
-   REM_NAME = r_name.upper()
-   REM_VALUE = r_value.upper()
-   done = False
-   for rem in range(MyREMS["nrems"]):
-      if (MyREMS["the_rem"][str(rem)]["name"] == REM_NAME):
-	#found in the rem already set up
-         MyREMS["the_rem"][str(rem)]["value"] = REM_VALUE
-         done = True
-   if (not done):	#not find, add this new rem
-      currem = MyREMS["nrems"]
-      MyREMS["the_rem"][str(currem)] = {}
-      MyREMS["the_rem"][str(currem)]["name"] = REM_NAME
-      MyREMS["the_rem"][str(currem)]["value"] = REM_VALUE
-      MyREMS["nrems"] = currem + 1
-   return
+   MyREMS.set(r_name, r_value)
 
 def ModRem_Frgm(r_name, r_value, MyREMS):
-   REM_NAME = r_name.upper()
-   REM_VALUE = r_value.upper()
-   done = False
-   for rem_frgm in range(MyREMS["nrems_frgm"]):
-      if (MyREMS["rem_frgm"][str(rem_frgm)]["name"] == REM_NAME):
-	     #found in the rem already set up
-         MyREMS["rem_frgm"][str(rem_frgm)]["value"] = REM_VALUE
-         done = True
-   if (not done):	#not find, add this new rem
-      currem_frgm = MyREMS["nrems_frgm"]
-      MyREMS["rem_frgm"][str(currem_frgm)] = {}
-      MyREMS["rem_frgm"][str(currem_frgm)]["name"] = REM_NAME
-      MyREMS["rem_frgm"][str(currem_frgm)]["value"] = REM_VALUE
-      MyREMS["nrems_frgm"] = currem_frgm + 1
-
+   MyREMS.set_frgm(r_name, r_value)
 
 def AppendRem(fh,MyREMS):
-   fh.write('$rem\n')
-   for rem in range(MyREMS["nrems"]):
-      fh.write(MyREMS["the_rem"][str(rem)]["name"]+'  '+MyREMS["the_rem"][str(rem)]["value"]+'\n')
-   fh.write('$end\n')
-   return
+   fh.write(MyREMS.text())
 
 def AppendRemFrgm(fh,MyREMS):
-   fh.write('\n$rem_frgm\n')
-   for rem_frgm in range(MyREMS["nrems_frgm"]):
-      fh.write(MyREMS["rem_frgm"][str(rem_frgm)]["name"]+'  '+ MyREMS["rem_frgm"][str(rem_frgm)]["value"]+'\n')
-   fh.write('$end\n')
-   return
+   fh.write(MyREMS.frgm_text())
 
 def copy_section_over(fw, filename):
    fr = open(filename, 'r')
@@ -243,6 +283,7 @@ def need_aux_basis(method):
    else:
       return False
 
+@qtime.timed()
 def set_rems_common(curREM, method, basis, coarse_level=0):
    add_basis_set(curREM, basis)
    #coarse_level: 0 (thresh = 14, 99590); 1 (thresh = 14, 75302); 2 (thresh = 12, SG-1)
@@ -380,6 +421,7 @@ def write_newplots_section(fw, n_pts):
    fw.write(' grid_points %d %d %d\n' %(n_pts, n_pts, n_pts))
    fw.write('$end\n')
 
+@qtime.timed()
 def set_popanal_rems(curREM, pop_scheme_list):
    do_hirsh = False
    do_iterhirsh = False
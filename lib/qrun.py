@@ -0,0 +1,108 @@
+import os, sys, re, time, threading
+import subprocess as sp
+import qstatus
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+#Local scheduler for Q-Chem jobs
+#Up to njobs qchem processes run at the same time, each with nthreads threads, so that the
+#node is filled with njobs x nthreads threads. Jobs are started largest first (by number of
+#atoms) so that the long ones do not trail at the end; finished outputs are skipped and
+#failed jobs are started again up to a number of retries.
+
+#number of atoms in the $molecule sections of an input ("read" counts as zero)
+def count_atoms(inputfile):
+   natoms = 0
+   in_molecule = False
+   fr = open(inputfile, 'r')
+   for line in fr:
+      l_sp = line.split()
+      if len(l_sp) == 0:
+         continue
+      if l_sp[0].lower() == '$molecule':
+         in_molecule = True
+      elif l_sp[0].lower() == '$end':
+         in_molecule = False
+      elif in_molecule and len(l_sp) >= 4:
+         natoms += 1
+   fr.close()
+   return natoms
+
+#the completion banner is at the end of the output (see qstatus)
+def job_finished(outfile, flag):
+   return os.path.exists(outfile) and qstatus.flag_in_tail(outfile, flag)
+
+#environment after sourcing a bashrc, to be passed to the qchem processes
+def source_env(bashrc):
+   try:
+      output = sp.check_output(['bash', '-c', 'source "%s" > /dev/null && env -0' %bashrc])
+   except sp.CalledProcessError as err:
+      print("Sourcing %s failed (exit code %d)" %(bashrc, err.returncode))
+      sys.exit(1)
+   env = {}
+   for item in output.decode().split('\0'):
+      if '=' in item:
+         key, value = item.split('=', 1)
+         env[key] = value
+   return env
+
+class JobRunner:
+   def __init__(self, exe='qchem', nthreads=8, njobs=1, retries=0, flag="Have a nice day", env=None):
+      self.exe = exe
+      self.nthreads = nthreads
+      self.njobs = njobs
+      self.retries = retries
+      self.flag = flag
+      self.env = env
+      self.lock = threading.Lock()
+      self.n_done = 0
+      self.n_failed = 0
+
+   def run_one(self, input_dir, inputfile):
+      outfile = inputfile[:-2]+'out'
+      for attempt in range(self.retries+1):
+         start = time.time()
+         fnull = open(os.devnull, 'w')
+         ret = sp.call([self.exe, '-nt', str(self.nthreads), inputfile, outfile], cwd=input_dir, env=self.env, stdout=fnull, stderr=sp.STDOUT)
+         fnull.close()
+         if ret == 0 and job_finished(os.path.join(input_dir, outfile), self.flag):
+            return True, attempt+1, time.time()-start
+      return False, self.retries+1, time.time()-start
+
+   def report(self, inputfile, success, attempts, elapsed, ntot, t0):
+      with self.lock:
+         self.n_done += 1
+         if not success:
+            self.n_failed += 1
+         status = "done" if success else "FAILED"
+         if attempts > 1:
+            status += " (%d attempts)" %attempts
+         rate = self.n_done / (time.time()-t0) * 3600.0
+         print("[%d/%d] %s: %s in %.1f s; %.1f jobs/hour" %(self.n_done, ntot, inputfile, status, elapsed, rate))
+         sys.stdout.flush()
+
+   #run the inputs of input_dir, returns the list of inputs that failed
+   def run(self, input_dir, inputfile_list, rerun=False):
+      jobs = []
+      n_skip = 0
+      for inputfile in inputfile_list:
+         if not rerun and job_finished(os.path.join(input_dir, inputfile[:-2]+'out'), self.flag):
+            n_skip += 1
+            continue
+         jobs.append((count_atoms(os.path.join(input_dir, inputfile)), inputfile))
+      jobs.sort(key=lambda job: (-job[0], job[1]))
+      print("%d jobs to run (%d already finished), %d at a time with %d threads each" %(len(jobs), n_skip, self.njobs, self.nthreads))
+      failed = []
+      t0 = time.time()
+      pool = ThreadPoolExecutor(max_workers=max(1, self.njobs))
+      futures = {}
+      for natoms, inputfile in jobs:
+         futures[pool.submit(self.run_one, input_dir, inputfile)] = inputfile
+      for future in as_completed(futures):
+         success, attempts, elapsed = future.result()
+         self.report(futures[future], success, attempts, elapsed, len(jobs), t0)
+         if not success:
+            failed.append(futures[future])
+      pool.shutdown()
+      wall = time.time() - t0
+      print("%d jobs finished, %d failed in %.1f s" %(len(jobs)-self.n_failed, self.n_failed, wall))
+      return sorted(failed)
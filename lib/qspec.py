@@ -0,0 +1,71 @@
+import os, sys
+import numpy as np
+
+#Broadened IR spectra of many jobs (e.g. MD snapshots) at once
+#The normal modes of all the jobs are packed into (njob, nmode) arrays, padded with zero
+#intensities, and every spectrum on the frequency grid is
+#   S_j(w) = sum_m I_jm * g(w - w_jm)
+#with g a unit-area Lorentzian or Gaussian line of the given FWHM, evaluated for blocks of
+#jobs as one array operation. Imaginary (negative) modes do not contribute.
+
+LINE_SHAPES = ['lorentzian', 'gaussian']
+#number of (job, mode, grid point) elements evaluated at a time
+BLOCK_SIZE = 1 << 24
+
+#jobname_list: the order of the rows; freq_data[jobname]["freq"] (and "intens") as lists
+#The jobs in jobname_list must have their modes: a job without any would be a zero spectrum
+def mode_arrays(freq_data, jobname_list, with_intens=True):
+   nmode = max([len(freq_data[jobname]["freq"]) for jobname in jobname_list] + [0])
+   freqs = np.zeros((len(jobname_list), nmode))
+   intens = np.zeros((len(jobname_list), nmode))
+   for ijob, jobname in enumerate(jobname_list):
+      n = len(freq_data[jobname]["freq"])
+      freqs[ijob,:n] = freq_data[jobname]["freq"]
+      if with_intens:
+         intens[ijob,:n] = freq_data[jobname]["intens"]
+      else:
+         intens[ijob,:n] = 1.0
+   return freqs, intens
+
+def line_shape(x, fwhm, shape='lorentzian'):
+   if shape == 'lorentzian':
+      hw = 0.5 * fwhm
+      return hw / np.pi / (x*x + hw*hw)
+   elif shape == 'gaussian':
+      sigma = fwhm / (2.0 * np.sqrt(2.0 * np.log(2.0)))
+      return np.exp(-0.5 * (x/sigma)**2) / (sigma * np.sqrt(2.0*np.pi))
+   else:
+      print("Unknown line shape: %s (available: %s)" %(shape, ', '.join(LINE_SHAPES)))
+      sys.exit(1)
+
+#spectra[j] on the grid, in the unit of the intensities per cm-1
+def broaden(freqs, intens, grid, fwhm, shape='lorentzian'):
+   freqs = np.atleast_2d(freqs)
+   intens = np.where(freqs > 0.0, np.atleast_2d(intens), 0.0)
+   spectra = np.zeros((freqs.shape[0], len(grid)))
+   nblock = max(1, BLOCK_SIZE // max(1, freqs.shape[1] * len(grid)))
+   for start in range(0, freqs.shape[0], nblock):
+      end = start + nblock
+      lines = line_shape(grid[None,None,:] - freqs[start:end,:,None], fwhm, shape)
+      spectra[start:end] = np.einsum('jm,jmw->jw', intens[start:end], lines)
+   return spectra
+
+def freq_grid(freq_min, freq_max, freq_step):
+   return freq_min + freq_step * np.arange(int(round((freq_max - freq_min) / freq_step)) + 1)
+
+def save_modes(npzfile, jobname_list, freqs, intens):
+   np.savez_compressed(npzfile, jobname=np.array(jobname_list), freq=freqs, intens=intens)
+
+#one column per job
+def write_spectra(csvfile, grid, spectra, jobname_list):
+   fw = open(csvfile, 'w')
+   fw.write('freq,' + ','.join(jobname_list) + '\n')
+   np.savetxt(fw, np.column_stack((grid, spectra.T)), fmt='%.6g', delimiter=',')
+   fw.close()
+
+#mean and standard deviation over the ensemble
+def write_average_spectrum(csvfile, grid, spectra):
+   fw = open(csvfile, 'w')
+   fw.write('freq,intensity,std\n')
+   np.savetxt(fw, np.column_stack((grid, spectra.mean(axis=0), spectra.std(axis=0))), fmt='%.6g', delimiter=',')
+   fw.close()
@@ -0,0 +1,176 @@
+import os, re, sys
+import numpy as np
+import qrems, qmol, qbatch
+
+#In silico Stark sweeps
+#Inputs: the jobs of all the geometries x field points are rendered in one process from one
+#parsed rem template, as make_input_sp_geom would write them with --dipole_field, and named
+#[xyz name][_cdft]_[+field].in. The job types are
+#   opt_freq/opt/freq  geometry jobs, with the tight optimization criteria
+#   sp                 single points at the geometries optimized under a field, with the
+#                      population analysis
+#Analysis: the frequencies (and IR intensities) of the jobs of a geometry are gathered into
+#(nfield, nmode) arrays, with the field points that failed left as NaN, and the tuning rates of
+#every mode of every geometry come from one batched weighted least-squares solve of
+#   nu(F) = nu0 + rate*F                  (linear)
+#   nu(F) = nu0 + rate*F + curv*F^2       (quadratic)
+#with F in MV/cm. Modes are matched by their order in the output.
+
+#the field label of the job names: +10, 0, -10
+def field_label(field):
+   if field > 0:
+      return '+'+str(field)
+   return str(field)
+
+JOB_NAME = re.compile('^(.+)_([+-]?[0-9]+(?:\.[0-9]*)?)$')
+
+#(geometry, field) from the job name, None if it has no field label
+def split_job_name(jobname):
+   l = JOB_NAME.search(jobname)
+   if l == None:
+      return None
+   return l.group(1), float(l.group(2))
+
+def append_single_geom_constraint(fw, constraint_template, XYZ, placeholder):
+   l = re.search(placeholder+'_([^_]+)', XYZ.Name)
+   if l == None:
+      print("No geom_param specified in xyz file name. Try different placeholder or you are screwed")
+      sys.exit(0)
+   qrems.apply_single_geom_constraint(fw, float(l.group(1)), constraint_template)
+
+def field_section(fw, field, field_atoms=None, field_dir='Z'):
+   if field == 0:
+      return
+   if field_atoms != None:
+      qrems.apply_dipolar_field_on_bond(fw, field, int(field_atoms[0]), int(field_atoms[1]))
+   else:
+      qrems.apply_dipolar_field(fw, field, field_dir)
+
+#the rems of the first job; opt_freq starts with the optimization
+def set_field_job_rems(curREM, jobtype, field, sweep):
+   if jobtype in ['opt', 'opt_freq']:
+      qrems.ModRem('JOBTYPE', 'OPT', curREM)
+      qrems.ModRem('GEOM_OPT_MAX_CYCLES', '200', curREM)
+      qrems.ModRem('GEOM_OPT_DRIVER', 'OPTIMIZE', curREM)
+   elif jobtype == 'freq':
+      qrems.ModRem('JOBTYPE', 'FREQ', curREM)
+      if sweep.isotope != None:
+         qrems.ModRem('ISOTOPES', 'TRUE', curREM)
+      if field != 0 or sweep.cdft != None:
+         qrems.ModRem('IDERIV', '1', curREM)
+   if jobtype != 'sp':
+      qrems.ModRem('GEOM_OPT_TOL_GRADIENT','100', curREM)
+      qrems.ModRem('GEOM_OPT_TOL_DISPLACEMENT', '100', curREM)
+      qrems.ModRem('GEOM_OPT_TOL_ENERGY', '10', curREM)
+   if sweep.sol != None:
+      qrems.ModRem('SOLVENT_METHOD', 'PCM', curREM)
+   if sweep.cdft != None:
+      qrems.ModRem('CDFT', 'TRUE', curREM)
+      qrems.ModRem('CDFT_THRESH', '6', curREM)
+      qrems.ModRem('BECKE_SHIFT', 'UNSHIFTED', curREM)
+   if jobtype == 'sp' and sweep.pop_anal != None:
+      qrems.set_popanal_rems(curREM, sweep.pop_anal)
+
+#the sections after the $rem of a job
+def job_sections(fw, field, sweep, with_isotope):
+   if sweep.sol != None:
+      qrems.AppendSolvationSecs(fw, 'PCM', sweep.sol, None)
+   field_section(fw, field, sweep.field_atoms, sweep.field_dir)
+   if with_isotope and sweep.isotope != None:
+      qbatch.copy_section_over(fw, sweep.isotope)
+   if sweep.cdft != None:
+      qbatch.copy_section_over(fw, sweep.cdft)
+
+#jobtype 'opt_freq' adds the frequency job under the same field on the optimized geometry
+def FieldJob_to_Input(fw, XYZ, curREM, field, jobtype, sweep):
+   fw.write(qbatch.molecule_block(XYZ, sweep.charge, 1))
+   fw.write(curREM.text())
+   if sweep.geom_constr != None:
+      append_single_geom_constraint(fw, sweep.geom_constr, XYZ, sweep.constr_key)
+   job_sections(fw, field, sweep, jobtype == 'freq')
+   if jobtype != 'opt_freq':
+      return
+   freqREM = curREM.copy()
+   fw.write("\n@@@\n\n")
+   qmol.WriteMolecule_Read(fw)
+   qrems.ModRem('JOBTYPE', 'FREQ', freqREM)
+   qrems.ModRem('SCF_GUESS', 'READ', freqREM)
+   if field != 0 or sweep.cdft != None:
+      qrems.ModRem('IDERIV', '1', freqREM)
+   if sweep.isotope != None:
+      qrems.ModRem('ISOTOPES', 'TRUE', freqREM)
+   fw.write(freqREM.text())
+   job_sections(fw, field, sweep, True)
+
+#fields: the field of every job (per geometry) in MV/cm
+#sweep: the options of make_input_stark_in_silico
+def add_field_jobs(XYZ, input_dir, base_rems, fields, jobtype, sweep):
+   for field in fields:
+      curREM = base_rems.copy()
+      set_field_job_rems(curREM, jobtype, field, sweep)
+      inputfile = os.path.join(input_dir, XYZ.Name + ('_cdft' if sweep.cdft != None else '') + '_' + field_label(field) + '.in')
+      qbatch.write_input(inputfile, FieldJob_to_Input, XYZ, curREM, field, jobtype, sweep)
+
+#records as from qcrawl.scan_outputs for one directory; returns the geometries, the sorted
+#fields and (G, F, M) frequencies and intensities, M being the largest number of modes of any
+#geometry: the mode axis of a geometry with fewer modes is padded with NaN, as are the
+#missing points. A field point whose number of modes differs from the one of most of the
+#points of its own geometry is left out.
+def gather_sweep(records):
+   jobs = {}
+   for outname, record in records:
+      key = split_job_name(re.sub('\.out$', '', os.path.basename(outname)))
+      if key == None or len(record["Frequency"]) == 0:
+         continue
+      jobs[key] = (record["Frequency"], record.get("IRIntens", np.array([])))
+   geoms = sorted(set([key[0] for key in jobs]))
+   fields = np.array(sorted(set([key[1] for key in jobs])))
+   nmode_geom = {}
+   for geom in geoms:
+      counts = [len(jobs[key][0]) for key in jobs if key[0] == geom]
+      nmode_geom[geom] = max(set(counts), key=lambda n: (counts.count(n), n))
+   nmode = max(list(nmode_geom.values()) + [0])
+   freq = np.full((len(geoms), len(fields), nmode), np.nan)
+   intens = np.full((len(geoms), len(fields), nmode), np.nan)
+   igeom = dict([(geom, i) for i, geom in enumerate(geoms)])
+   ifield = dict([(field, i) for i, field in enumerate(fields)])
+   for (geom, field), (freqs, intensities) in jobs.items():
+      n = nmode_geom[geom]
+      if len(freqs) != n:
+         print("Skip %s at %g MV/cm: %d modes instead of %d" %(geom, field, len(freqs), n))
+         continue
+      freq[igeom[geom], ifield[field], :n] = freqs
+      if len(intensities) == n:
+         intens[igeom[geom], ifield[field], :n] = intensities
+   return geoms, fields, freq, intens
+
+#fit y (G, F, M) against the fields (F,) with a polynomial of the given order for all (G, M)
+#at once; the points where y is NaN are left out. Returns coefficients (G, M, order+1) from
+#the constant term up (NaN where there are too few points) and the number of points (G, M)
+def fit_tuning_rates(fields, y, order=1):
+   X = np.vander(np.asarray(fields, dtype=float), order+1, increasing=True)
+   w = ~np.isnan(y)
+   y0 = np.where(w, y, 0.0)
+   XtWX = np.einsum('fi,gfm,fj->gmij', X, w.astype(float), X)
+   XtWy = np.einsum('fi,gfm->gmi', X, y0)
+   npoints = w.sum(axis=1)
+   ok = npoints > order
+   coef = np.full(XtWy.shape, np.nan)
+   if np.any(ok):
+      coef[ok] = np.linalg.solve(XtWX[ok], XtWy[ok][..., np.newaxis])[..., 0]
+   return coef, npoints
+
+def write_sweep_arrays(npzfile, geoms, fields, freq, intens):
+   np.savez_compressed(npzfile, geometry=np.array(geoms), field=fields, freq=freq, intens=intens)
+
+#one row per geometry and mode (the padding modes of a geometry are left out)
+def write_tuning_rates(csvfile, geoms, freq, lin, quad, npoints, ifield0=None):
+   fw = open(csvfile, 'w')
+   fw.write('geometry,mode,n_fields,freq_0,nu0_linear,rate_linear,nu0_quad,rate_quad,curv_quad\n')
+   for igeom, geom in enumerate(geoms):
+      for imode in range(freq.shape[2]):
+         if npoints[igeom, imode] == 0:
+            continue
+         freq_0 = freq[igeom, ifield0, imode] if ifield0 != None else np.nan
+         fw.write('%s,%d,%d,%.2f,%.4f,%.6f,%.4f,%.6f,%.8f\n' %(geom, imode+1, npoints[igeom, imode], freq_0, lin[igeom, imode, 0], lin[igeom, imode, 1], quad[igeom, imode, 0], quad[igeom, imode, 1], quad[igeom, imode, 2]))
+   fw.close()
@@ -0,0 +1,101 @@
+import os, sys
+import numpy as np
+
+#Statistics of correlated time series (MD snapshots)
+#All functions take the frames along axis 0 and any number of trailing axes (cutoffs, bonds,
+#...), which are treated as independent series and evaluated in one array operation.
+#   mean/std     two-pass (centered) moments, population standard deviation as before
+#   block_se     blocking analysis (Flyvbjerg & Petersen): the frames are averaged in pairs
+#                level after level; the standard error of the mean grows with the block
+#                size until the blocks are decorrelated. The largest estimate among the
+#                levels that keep at least MIN_BLOCKS blocks is reported.
+#   bootstrap_se circular block bootstrap: the series is rebuilt from randomly placed blocks
+#                of block_len consecutive frames, keeping the autocorrelation within a block
+#The naive standard error std/sqrt(n) assumes uncorrelated frames and underestimates the
+#error of MD averages; block_se and bootstrap_se do not.
+
+MIN_BLOCKS = 32
+
+#mean and population standard deviation over axis 0
+def moments(x):
+   x = np.asarray(x, dtype=float)
+   mean = x.mean(axis=0)
+   std = np.sqrt(np.mean((x - mean)**2, axis=0))
+   return mean, std
+
+#standard errors of the mean at every blocking level; returns block sizes and (nlevel, ...)
+def blocking_levels(x):
+   x = np.asarray(x, dtype=float)
+   sizes = []
+   se = []
+   size = 1
+   while x.shape[0] >= 2:
+      n = x.shape[0]
+      var = np.mean((x - x.mean(axis=0))**2, axis=0)
+      sizes.append(size)
+      se.append(np.sqrt(var / (n - 1)))
+      x = 0.5 * (x[:n//2*2:2] + x[1:n//2*2:2])
+      size *= 2
+   return np.array(sizes, dtype=int), np.array(se)
+
+def block_se(x, min_blocks=MIN_BLOCKS):
+   x = np.asarray(x, dtype=float)
+   sizes, se = blocking_levels(x)
+   if len(sizes) == 0:
+      return np.zeros(x.shape[1:])
+   keep = (x.shape[0] // sizes) >= min_blocks
+   keep[0] = True
+   return se[keep].max(axis=0)
+
+#default bootstrap block length: n^(1/3)
+def default_block_len(n):
+   return max(1, int(round(n ** (1.0/3.0))))
+
+def bootstrap_se(x, block_len=None, nboot=1000, seed=None):
+   x = np.asarray(x, dtype=float)
+   n = x.shape[0]
+   if n < 2:
+      return np.zeros(x.shape[1:])
+   if block_len == None:
+      block_len = default_block_len(n)
+   block_len = min(block_len, n)
+   nblock = -(-n // block_len)
+   #sums of the block_len frames starting at every frame, wrapping around the end
+   wrapped = np.concatenate((x, x[:block_len-1]), axis=0)
+   csum = np.concatenate((np.zeros((1,) + x.shape[1:]), np.cumsum(wrapped, axis=0)), axis=0)
+   block_sums = csum[block_len:block_len+n] - csum[:n]
+   rng = np.random.default_rng(seed)
+   starts = rng.integers(0, n, size=(nboot, nblock))
+   boot_means = block_sums[starts].sum(axis=1) / float(nblock * block_len)
+   return boot_means.std(axis=0, ddof=1)
+
+#{name: array over the trailing axes} for a (F, ...) series
+def series_statistics(x, block_len=None, nboot=1000, seed=None):
+   x = np.asarray(x, dtype=float)
+   mean, std = moments(x)
+   stats = {'avg': mean, 'std': std, 'se': std / np.sqrt(float(x.shape[0])), 'block_se': block_se(x)}
+   if nboot > 0:
+      stats['boot_se'] = bootstrap_se(x, block_len, nboot, seed)
+   return stats
+
+#x (F, C, ...) with valid (F, C): the statistics of every column c over its own valid frames
+#(e.g. the frames found for each cutoff); columns without frames are NaN
+def masked_statistics(x, valid, block_len=None, nboot=1000, seed=None):
+   x = np.asarray(x, dtype=float)
+   if valid.all():
+      return series_statistics(x, block_len, nboot, seed)
+   stats = {}
+   for ic in range(x.shape[1]):
+      if not valid[:, ic].any():
+         continue
+      column = series_statistics(x[valid[:, ic], ic], block_len, nboot, seed)
+      for name in column:
+         if name not in stats:
+            stats[name] = np.full(x.shape[1:], np.nan)
+         stats[name][ic] = column[name]
+   return stats
+
+def add_stat_options(parser):
+   parser.add_option('--nboot',dest='nboot',action='store',type='int',default=1000,help='number of bootstrap samples for the block-bootstrap standard error (0: skip; default: 1000)')
+   parser.add_option('--block_len',dest='block_len',action='store',type='int',default=None,help='block length (frames) of the bootstrap (default: nframes^(1/3))')
+   parser.add_option('--seed',dest='seed',action='store',type='int',default=None,help='random seed of the bootstrap')
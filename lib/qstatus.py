@@ -0,0 +1,51 @@
+import os, sys
+import qcrawl
+
+#Completion check of Q-Chem outputs
+#The completion banner is printed at the very end of a job, so a single-job output is
+#finished iff the banner is in its tail; for multi-job outputs the file is read in large
+#chunks and the read stops as soon as the expected number of banners has been seen.
+#Together with qcache, an output is only read again when its size or mtime changed.
+
+TAIL_BYTES = 65536
+CHUNK_BYTES = 1 << 22
+#printed instead of the completion banner when a job stops on an error
+ERROR_FLAG = "Q-Chem fatal error occurred"
+
+def flag_in_tail(outfile, flag, tail_bytes=TAIL_BYTES):
+   fr = open(outfile, 'rb')
+   fr.seek(0, os.SEEK_END)
+   fr.seek(max(0, fr.tell() - tail_bytes))
+   tail = fr.read()
+   fr.close()
+   return flag.encode() in tail
+
+#number of banners in the output, counting at most "expected" of them
+def count_flags(outfile, flag, expected=1):
+   if expected <= 1:
+      return int(flag_in_tail(outfile, flag))
+   flag = flag.encode()
+   count = 0
+   overlap = b''
+   fr = open(outfile, 'rb')
+   chunk = fr.read(CHUNK_BYTES)
+   while chunk != b'' and count < expected:
+      #a banner split between two chunks is found in the overlap
+      block = overlap + chunk
+      count += block.count(flag)
+      overlap = block[-(len(flag)-1):] if len(flag) > 1 else b''
+      chunk = fr.read(CHUNK_BYTES)
+   fr.close()
+   return min(count, expected)
+
+#item: (flag, expected)
+def status_worker(task):
+   outfile, item_list = task
+   counts = {}
+   for item in item_list:
+      counts[item] = count_flags(outfile, item[0], item[1])
+   return counts
+
+#records[outdir] = [(outname, {(flag, expected): count}), ...]
+def status_outputs(outdir_list, flag, expected=1, nproc=1, pattern="*.out", cache=None):
+   return qcrawl.crawl(outdir_list, status_worker, [(flag, expected)], nproc, pattern, cache)
@@ -0,0 +1,147 @@
+import os, sys, csv
+import numpy as np
+import qtime
+
+#Columnar output of the parsed results
+#Every parser can hand its results to a ResultTable in one long (tidy) schema,
+#   job   : the name of the output directory the result comes from
+#   index : the job name or the indexing parameter (frame, distance, snapshot ID, ...); the
+#           column is numeric if every index is a number, strings otherwise
+#   state : electronic state or normal mode (0 when not applicable)
+#   term  : the name of the quantity (E_int, E_ex, osc, freq, ...)
+#   value : the value (float64)
+#which is then written by one of the backends below. The per-parser CSV files are still
+#written as before; the table is an additional output requested with --table_format.
+
+COLUMNS = ['job', 'index', 'state', 'term', 'value']
+TABLE_EXT = {'csv': '.csv', 'parquet': '.parquet', 'hdf5': '.h5'}
+#optional packages needed by the backends (on top of pandas)
+TABLE_MODULES = {'parquet': ('pyarrow', 'pyarrow'), 'hdf5': ('tables', 'PyTables')}
+
+def number_or_none(index):
+   if isinstance(index, bool):
+      return None
+   if isinstance(index, (int, float)):
+      return index
+   for kind in (int, float):
+      try:
+         return kind(index)
+      except (TypeError, ValueError):
+         continue
+   return None
+
+class ResultTable:
+   def __init__(self):
+      self.job = []
+      self.index = []
+      self.state = []
+      self.term = []
+      self.value = []
+
+   def __len__(self):
+      return len(self.value)
+
+   def add(self, job, index, term, value, state=0):
+      self.job.append(os.path.basename(os.path.normpath(job)))
+      self.index.append(index.item() if isinstance(index, np.generic) else index)
+      self.state.append(int(state))
+      self.term.append(str(term))
+      self.value.append(float(value))
+
+   #a vector value (dipole, ...) is stored as term_x, term_y, term_z
+   def add_vector(self, job, index, term, vec, state=0):
+      for axis, value in zip('xyz', vec):
+         self.add(job, index, term+'_'+axis, value, state)
+
+   #DataPoints[index][term] = value, nested dictionaries (e.g. [index][method][term]) give
+   #terms named "method:term"; prefix is put in front of every term
+   def add_points(self, job, DataPoints, prefix='', state=0):
+      for index in DataPoints:
+         self.add_terms(job, index, DataPoints[index], prefix, state)
+
+   def add_terms(self, job, index, terms, prefix='', state=0):
+      for term in terms:
+         if isinstance(terms[term], dict):
+            self.add_terms(job, index, terms[term], prefix+term+':', state)
+         else:
+            self.add(job, index, prefix+term, terms[term], state)
+
+   #numeric if every index is a number (or the text of one, e.g. a distance taken from a job
+   #name), the indices as strings otherwise
+   def index_column(self):
+      values = [number_or_none(index) for index in self.index]
+      if all([isinstance(value, int) for value in values]):
+         return np.array(values, dtype=np.int64)
+      if all([value != None for value in values]):
+         return np.array(values, dtype=np.float64)
+      return np.array([str(index) for index in self.index], dtype=object)
+
+   def columns(self):
+      return {'job': np.array(self.job, dtype=object), 'index': self.index_column(), 'state': np.array(self.state, dtype=np.int32), 'term': np.array(self.term, dtype=object), 'value': np.array(self.value, dtype=np.float64)}
+
+   def frame(self):
+      import pandas as pd
+      df = pd.DataFrame(self.columns(), columns=COLUMNS)
+      #job and term only take a few distinct values
+      df['job'] = df['job'].astype('category')
+      df['term'] = df['term'].astype('category')
+      return df
+
+   #write the table to path_root + the extension of the backend, returns the file name
+   @qtime.timed()
+   def write(self, path_root, table_format='csv'):
+      if table_format not in TABLE_WRITERS:
+         print("Unknown table format: %s (available: %s)" %(table_format, ', '.join(sorted(TABLE_WRITERS))))
+         sys.exit(1)
+      path = path_root + TABLE_EXT[table_format]
+      TABLE_WRITERS[table_format](self, path)
+      print("%d results written to %s" %(len(self), path))
+      return path
+
+def write_csv(table, path):
+   fw = open(path, 'w', newline='')
+   writer = csv.writer(fw)
+   writer.writerow(COLUMNS)
+   writer.writerows(zip(table.job, table.index, table.state, table.term, [repr(value) for value in table.value]))
+   fw.close()
+
+def write_parquet(table, path):
+   table.frame().to_parquet(path, compression='zstd', index=False)
+
+def write_hdf5(table, path):
+   import pandas as pd
+   df = table.frame()
+   #categories are stored as plain strings in the fixed-width HDF5 table
+   df['job'] = df['job'].astype(str)
+   df['term'] = df['term'].astype(str)
+   min_itemsize = {'job': 64, 'term': 64}
+   if not pd.api.types.is_numeric_dtype(df['index']):
+      min_itemsize['index'] = 64
+   df.to_hdf(path, key='results', mode='w', format='table', complevel=9, complib='blosc:zstd', min_itemsize=min_itemsize)
+
+TABLE_WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'hdf5': write_hdf5}
+
+def add_table_option(parser):
+   parser.add_option('--table_format', dest='table_format', action='store', type='choice', choices=sorted(TABLE_WRITERS), default=None, help='also write all the parsed results as one long table (job, index, state, term, value) in the given format: csv, parquet or hdf5')
+
+#stop before any output is parsed if the backend can not be used
+def check_backend(table_format):
+   if table_format not in TABLE_MODULES:
+      return
+   module, package = TABLE_MODULES[table_format]
+   try:
+      __import__(module)
+   except ImportError:
+      print("The %s backend needs %s (pip install %s)" %(table_format, package, module))
+      sys.exit(1)
+
+#None if no table was requested
+def open_table(options):
+   if options.table_format == None:
+      return None
+   check_backend(options.table_format)
+   return ResultTable()
+
+def close_table(table, options, path_root):
+   if table != None:
+      table.write(path_root, options.table_format)
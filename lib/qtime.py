@@ -0,0 +1,134 @@
+import os, sys, time, json, atexit, functools
+from collections import OrderedDict
+
+#Timing and profiling of the batch scripts
+#The scripts time their phases with "with qtime.phase(name):" and the library functions
+#decorated with qtime.timed() are timed under their module.function name. Every phase
+#accumulates its wall time, number of calls and the files/bytes reported with
+#qtime.count, from which the throughput is printed at exit. Nothing is recorded unless
+#--timing or --profile is given; --profile also runs the script under cProfile and writes
+#   [script]_profile.pstats  the raw profile (python -m pstats [script]_profile.pstats)
+#   [script]_profile.txt     the functions sorted by cumulative time
+#   [script]_profile.json    the phase timings
+#in the working directory. Work done in the worker processes (-j) is only seen as the wall
+#time of the phase that waits for it.
+
+_phases = OrderedDict()
+_enabled = False
+_profiler = None
+_t_start = None
+
+class PhaseTimer:
+   def __init__(self):
+      self.seconds = 0.0
+      self.calls = 0
+      self.files = 0
+      self.nbytes = 0
+
+def enabled():
+   return _enabled
+
+def get_phase(name):
+   if name not in _phases:
+      _phases[name] = PhaseTimer()
+   return _phases[name]
+
+#files and bytes processed in a phase
+def count(name, files=0, nbytes=0):
+   if not _enabled:
+      return
+   timer = get_phase(name)
+   timer.files += files
+   timer.nbytes += nbytes
+
+class phase:
+   def __init__(self, name, files=0, nbytes=0):
+      self.name = name
+      self.files = files
+      self.nbytes = nbytes
+
+   def __enter__(self):
+      if _enabled:
+         self.t0 = time.perf_counter()
+      return self
+
+   def __exit__(self, exc_type, exc_value, traceback):
+      if _enabled:
+         timer = get_phase(self.name)
+         timer.seconds += time.perf_counter() - self.t0
+         timer.calls += 1
+         timer.files += self.files
+         timer.nbytes += self.nbytes
+      return False
+
+#decorator timing every call of a library function
+def timed(name=None):
+   def decorate(func):
+      module = func.__module__ if func.__module__ != '__main__' else os.path.basename(sys.argv[0])
+      label = name if name != None else module + '.' + func.__qualname__
+      @functools.wraps(func)
+      def wrapper(*args, **kwargs):
+         if not _enabled:
+            return func(*args, **kwargs)
+         with phase(label):
+            return func(*args, **kwargs)
+      return wrapper
+   return decorate
+
+#total size of the files that exist, for the bytes-per-second counters
+def file_bytes(file_list):
+   if not _enabled:
+      return 0
+   return sum([os.path.getsize(filename) for filename in file_list if os.path.isfile(filename)])
+
+def add_timing_options(parser):
+   parser.add_option('--timing',dest='timing',action='store_true',default=False,help='print the time, files/s and MB/s of every phase at the end')
+   parser.add_option('--profile',dest='profile',action='store_true',default=False,help='also profile the script with cProfile; writes [script]_profile.pstats/.txt/.json in the working directory')
+
+def start(options):
+   global _enabled, _profiler, _t_start
+   if not (options.timing or options.profile):
+      return
+   _enabled = True
+   _t_start = time.perf_counter()
+   if options.profile:
+      import cProfile
+      _profiler = cProfile.Profile()
+      _profiler.enable()
+   atexit.register(finish, options)
+
+def summary():
+   wall = time.perf_counter() - _t_start
+   phases = []
+   for name in _phases:
+      timer = _phases[name]
+      rate = lambda amount: amount / timer.seconds if timer.seconds > 0 else 0.0
+      phases.append(OrderedDict([('name', name), ('seconds', timer.seconds), ('calls', timer.calls), ('files', timer.files), ('bytes', timer.nbytes), ('files_per_s', rate(timer.files)), ('bytes_per_s', rate(timer.nbytes))]))
+   return OrderedDict([('script', os.path.basename(sys.argv[0])), ('argv', sys.argv[1:]), ('wall_seconds', wall), ('phases', phases)])
+
+def print_summary(data):
+   print("%-40s %10s %8s %8s %10s %10s" %('phase', 'time (s)', 'calls', 'files', 'files/s', 'MB/s'))
+   for item in data['phases']:
+      print("%-40s %10.3f %8d %8d %10.1f %10.2f" %(item['name'][:40], item['seconds'], item['calls'], item['files'], item['files_per_s'], item['bytes_per_s']/1e6))
+   print("%-40s %10.3f" %('total (wall)', data['wall_seconds']))
+
+def finish(options):
+   global _enabled, _profiler
+   if not _enabled:
+      return
+   data = summary()
+   _enabled = False
+   print_summary(data)
+   if _profiler != None:
+      import pstats
+      _profiler.disable()
+      prefix = os.path.basename(sys.argv[0]) + '_profile'
+      _profiler.dump_stats(prefix + '.pstats')
+      fw = open(prefix + '.txt', 'w')
+      pstats.Stats(_profiler, stream=fw).sort_stats('cumulative').print_stats(60)
+      fw.close()
+      fw = open(prefix + '.json', 'w')
+      json.dump(data, fw, indent=1)
+      fw.close()
+      _profiler = None
+      print("Profile written to %s.pstats, %s.txt and %s.json" %(prefix, prefix, prefix))
@@ -1,6 +1,7 @@
-import os, glob, re, sys
+import os, glob, re, sys, struct
 import subprocess as sp
 import numpy as np
+import qcrawl
 
 def parse_xyz_file(filename):
    AtomList = []
@@ -16,63 +17,83 @@ def parse_xyz_file(filename):
    Coords = np.array(CoordList)
    return AtomList, Coords
 
-def compute_distance(Coords, idx1, idx2):
-   vec_12 = Coords[idx2-1] - Coords[idx1-1]
-   return np.linalg.norm(vec_12)
+#Batch measurements: Idx is a (K,2)/(K,3)/(K,4) array of 1-based atom indices and Coords is
+#either one geometry (N_atoms, 3) or a stack of frames (N_frames, N_atoms, 3); the results
+#have shape (K,) or (N_frames, K). Angles are in degree.
+def bond_vectors(Coords, idx_from, idx_to):
+   Coords = np.asarray(Coords)
+   return Coords[..., np.asarray(idx_to)-1, :] - Coords[..., np.asarray(idx_from)-1, :]
 
-def compute_angle(Coords, idx1, idx2, idx3):
-   vec_21 = Coords[idx1-1] - Coords[idx2-1]
-   vec_21 /= np.linalg.norm(vec_21)
-   vec_23 = Coords[idx3-1] - Coords[idx2-1]
-   vec_23 /= np.linalg.norm(vec_23)
-   theta = np.arccos(np.dot(vec_21, vec_23)) * 180.0/np.pi
-   return theta
+def unit_vectors(vecs):
+   return vecs / np.linalg.norm(vecs, axis=-1, keepdims=True)
 
-def compute_tilt_angle(Coords, idx1, idx2, idx3, idx4):
-   #the angle between idx1-idx2 and the bisector of \angle idx3-idx2-idx4
-   vec_21 = Coords[idx1-1] - Coords[idx2-1]
-   vec_21 /= np.linalg.norm(vec_21)
-   vec_23 = Coords[idx3-1] - Coords[idx2-1]
-   vec_23 /= np.linalg.norm(vec_23)
-   vec_24 = Coords[idx4-1] - Coords[idx2-1]
-   vec_24 /= np.linalg.norm(vec_24)
-   vec_bisec = vec_23 + vec_24
-   vec_bisec /= np.linalg.norm(vec_bisec)
-   theta = np.arccos(np.dot(vec_bisec, vec_21)) * 180.0/np.pi
-   return theta
+def vector_angles(vec_a, vec_b):
+   cos_theta = np.sum(unit_vectors(vec_a) * unit_vectors(vec_b), axis=-1)
+   return np.arccos(np.clip(cos_theta, -1.0, 1.0)) * 180.0/np.pi
 
-def compute_angle_w_axis(Coords, idx1, idx2, axis='Z'):
-   #bond direction
-   dir_bond = Coords[idx2-1] - Coords[idx1-1]
-   dir_bond /= np.linalg.norm(dir_bond)
-   #angle between bond and the given axis
+def index_columns(Idx, ncol):
+   Idx = np.asarray(Idx, dtype=np.int64).reshape(-1, ncol)
+   return [Idx[:,icol] for icol in range(ncol)]
+
+def compute_distances(Coords, Idx):
+   idx1, idx2 = index_columns(Idx, 2)
+   return np.linalg.norm(bond_vectors(Coords, idx1, idx2), axis=-1)
+
+#the angles idx1-idx2-idx3
+def compute_angles(Coords, Idx):
+   idx1, idx2, idx3 = index_columns(Idx, 3)
+   return vector_angles(bond_vectors(Coords, idx2, idx1), bond_vectors(Coords, idx2, idx3))
+
+#the angles between idx1-idx2 and the bisector of \angle idx3-idx2-idx4
+def compute_tilt_angles(Coords, Idx):
+   idx1, idx2, idx3, idx4 = index_columns(Idx, 4)
+   vec_bisec = unit_vectors(bond_vectors(Coords, idx2, idx3)) + unit_vectors(bond_vectors(Coords, idx2, idx4))
+   return vector_angles(vec_bisec, bond_vectors(Coords, idx2, idx1))
+
+def axis_vector(axis='Z'):
    if axis.upper() == 'Z':
-      dir_axis = np.array([0, 0, 1.])
+      return np.array([0, 0, 1.])
    elif axis.upper() == 'X':
-      dir_axis = np.array([1., 0, 0])
+      return np.array([1., 0, 0])
    elif axis.upper() == 'Y':
-      dir_axis = np.array([0, 1., 0])
+      return np.array([0, 1., 0])
    else:
       print ("The give axis %s is not recognizable" %axis)
       sys.exit(0)
-   angle = np.arccos(np.dot(dir_bond, dir_axis)) * 180.0 / np.pi
-   return angle
+
+#the angles between the bonds idx1->idx2 and the given axis
+def compute_angles_w_axis(Coords, Idx, axis='Z'):
+   idx1, idx2 = index_columns(Idx, 2)
+   dir_bond = bond_vectors(Coords, idx1, idx2)
+   return vector_angles(dir_bond, np.broadcast_to(axis_vector(axis), dir_bond.shape))
+
+def compute_dihedrals(Coords, Idx):
+   idx1, idx2, idx3, idx4 = index_columns(Idx, 4)
+   b1 = bond_vectors(Coords, idx1, idx2)
+   b2 = bond_vectors(Coords, idx2, idx3)
+   b3 = bond_vectors(Coords, idx3, idx4)
+   n1 = unit_vectors(np.cross(b1, b2))
+   n2 = unit_vectors(np.cross(b2, b3))
+   m1 = np.cross(n1, unit_vectors(b2))
+   x = np.sum(n1 * n2, axis=-1)
+   y = np.sum(m1 * n2, axis=-1)
+   return np.arctan2(y, x) * 180.0/np.pi
+
+#single measurements (the input index starts from 1)
+def compute_distance(Coords, idx1, idx2):
+   return np.take(compute_distances(Coords, [idx1, idx2]), 0, axis=-1)
+
+def compute_angle(Coords, idx1, idx2, idx3):
+   return np.take(compute_angles(Coords, [idx1, idx2, idx3]), 0, axis=-1)
+
+def compute_tilt_angle(Coords, idx1, idx2, idx3, idx4):
+   return np.take(compute_tilt_angles(Coords, [idx1, idx2, idx3, idx4]), 0, axis=-1)
+
+def compute_angle_w_axis(Coords, idx1, idx2, axis='Z'):
+   return np.take(compute_angles_w_axis(Coords, [idx1, idx2], axis), 0, axis=-1)
 
 def compute_diheral(Coords, idx1, idx2, idx3, idx4):
-   #the input index starts from 1
-   b1 = Coords[idx2-1] - Coords[idx1-1]
-   b2 = Coords[idx3-1] - Coords[idx2-1]
-   b3 = Coords[idx4-1] - Coords[idx3-1]
-   n1 = np.cross(b1, b2)
-   n1 /= np.linalg.norm(n1)
-   n2 = np.cross(b2, b3)
-   n2 /= np.linalg.norm(n2)
-   b2 /= np.linalg.norm(b2)
-   m1 = np.cross(n1, b2)
-   x = np.dot(n1, n2)
-   y = np.dot(m1, n2)
-   theta = np.arctan2(y,x) * 180.0/np.pi
-   return theta
+   return np.take(compute_dihedrals(Coords, [idx1, idx2, idx3, idx4]), 0, axis=-1)
 
 def bohr_to_angs(Coords):
    Coords *= 0.529177
@@ -87,6 +108,13 @@ def write_xyz_file(outfile, AtomList, Coords):
       fw.write("%-3s %15.10f %15.10f %15.10f\n" %(AtomList[iAtom], x, y, z))
    fw.close()
 
+#the atom lines of write_xyz_file, formatted with one call (for the writers of many geometries)
+def xyz_lines(AtomList, Coords):
+   table = np.empty((len(AtomList), 4), dtype=object)
+   table[:, 0] = AtomList
+   table[:, 1:] = Coords
+   return (("%-3s %15.10f %15.10f %15.10f\n" * len(AtomList)) %tuple(table.ravel())).splitlines(True)
+
 def write_xyz_file_w_energy(outfile, AtomList, Coords, energy):
    fw = open(outfile, 'w')
    fw.write("%d\n" %len(AtomList))
@@ -98,9 +126,7 @@ def write_xyz_file_w_energy(outfile, AtomList, Coords, energy):
 
 def set_origin(Coords, idx_orig):
    print("Set the position of Atom %d as the origin" %idx_orig)
-   origin = np.copy(Coords[idx_orig-1])
-   for i in range(0, Coords.shape[0]):
-      Coords[i] -= origin
+   Coords -= np.copy(Coords[idx_orig-1])
 
 def set_xy_plane(Coords, idx1, idx2, idx3):
    print("Set the plane determined by atoms %d, %d, %d as the xy-plane" %(idx1, idx2, idx3)) 
@@ -179,7 +205,7 @@ def reflection(Coords, mirror_pos, normal_axis='z'):
       Coords[:,0] = 2*mirror_pos - Coords[:,0]
    elif normal_axis.lower() == 'y':
       print("reflection with respect to the mirror at y = %.2f" %mirror_pos)
-      Coords[:,0] = 2*mirror_pos - Coords[:,1]
+      Coords[:,1] = 2*mirror_pos - Coords[:,1]
    return Coords 
 
 def pivot(Coords_orig, reverse=False):
@@ -195,3 +221,459 @@ def pivot(Coords_orig, reverse=False):
       Coords[:,1] = np.copy(Coords_orig[:,0])
       Coords[:,2] = np.copy(Coords_orig[:,1])
    return Coords
+
+#Rigid-body transform pipeline
+#The operations above are recorded as steps and composed into one 4x4 affine matrix M acting on
+#row vectors, [x' y' z' 1] = [x y z 1] M, so that a whole stack of frames is transformed by a
+#single matmul. Steps that depend on the geometry (origin on an atom, plane or bond alignment)
+#give one matrix per frame, computed from the positions of their atoms after the previous steps.
+def affine_matrix(rotmat=None, shift=None):
+   shape = np.shape(rotmat)[:-2] if rotmat is not None else np.shape(shift)[:-1]
+   M = np.zeros(shape + (4, 4))
+   M[..., 3, 3] = 1.0
+   M[..., :3, :3] = np.eye(3) if rotmat is None else rotmat
+   if shift is not None:
+      M[..., 3, :3] = shift
+   return M
+
+#the rotation matrices (in the row-vector convention) used by rotate_cylindrical
+def axis_rotation(angle, axis='z'):
+   angle = np.asarray(angle, dtype=float)
+   c, s = np.cos(angle), np.sin(angle)
+   one, zero = np.ones_like(c), np.zeros_like(c)
+   if axis == 'x':
+      rows = [[one, zero, zero], [zero, c, -s], [zero, s, c]]
+   elif axis == 'y':
+      rows = [[c, zero, s], [zero, one, zero], [-s, zero, c]]
+   elif axis == 'z':
+      rows = [[c, -s, zero], [s, c, zero], [zero, zero, one]]
+   else:
+      print("Invalid value for variable \"axis\"")
+      sys.exit(0)
+   return np.stack([np.stack(row, axis=-1) for row in rows], axis=-2)
+
+class TransformPipeline:
+   def __init__(self):
+      self.steps = []
+
+   #step(positions) -> (4, 4) or (nframes, 4, 4); positions(idx) gives the current (nframes, 3) positions of atom idx
+   def add_step(self, description, step):
+      self.steps.append((description, step))
+      return self
+
+   def set_origin(self, idx_orig):
+      return self.add_step("set the position of atom %d as the origin" %idx_orig, lambda positions: affine_matrix(shift=-positions(idx_orig)))
+
+   def set_xy_plane(self, idx1, idx2, idx3):
+      def step(positions):
+         dx = positions(idx2) - positions(idx1)
+         dy = positions(idx3) - positions(idx1)
+         xprime = unit_vectors(dx)
+         zprime = unit_vectors(np.cross(dx, dy))
+         yprime = np.cross(zprime, xprime)
+         return affine_matrix(rotmat=np.stack((xprime, yprime, zprime), axis=-1))
+      return self.add_step("set the plane determined by atoms %d, %d, %d as the xy-plane" %(idx1, idx2, idx3), step)
+
+   def translate(self, distance, axis='z'):
+      shift = np.zeros(3)
+      shift['xyz'.index(axis.lower())] = distance
+      return self.add_step("translate atoms along the %s axis by %.4f Angstrom" %(axis.lower(), distance), lambda positions: affine_matrix(shift=shift))
+
+   def rotate(self, angle, axis='z', use_degree=True):
+      rad = angle * np.pi / 180.0 if use_degree else angle
+      return self.add_step("rotate around the %s axis by %f degrees" %(axis, rad * 180.0 / np.pi), lambda positions: affine_matrix(rotmat=axis_rotation(rad, axis)))
+
+   def rotate_nfold(self, fold):
+      return self.rotate(360.0 / fold, 'z')
+
+   def reflection(self, mirror_pos, normal_axis='z'):
+      iaxis = 'xyz'.index(normal_axis.lower())
+      rotmat = np.eye(3)
+      rotmat[iaxis, iaxis] = -1.0
+      shift = np.zeros(3)
+      shift[iaxis] = 2 * mirror_pos
+      return self.add_step("reflection with respect to the mirror at %s = %.2f" %(normal_axis.lower(), mirror_pos), lambda positions: affine_matrix(rotmat, shift))
+
+   def pivot(self, reverse=False):
+      #x->y, y->z, z->x (reverse: x->z, y->x, z->y)
+      rotmat = np.zeros((3, 3))
+      for icol, irow in enumerate((1, 2, 0) if reverse else (2, 0, 1)):
+         rotmat[irow, icol] = 1.0
+      return self.add_step("pivot the axes", lambda positions: affine_matrix(rotmat=rotmat))
+
+   def scale(self, factor):
+      return self.add_step("scale the coordinates by %f" %factor, lambda positions: affine_matrix(rotmat=factor * np.eye(3)))
+
+   def bohr_to_angs(self):
+      return self.scale(0.529177)
+
+   #atom idx1 at the origin and the bond idx1->idx2 along the z axis (as in rotate_bond_to_axis)
+   def align_bond_to_z(self, idx1, idx2):
+      def step(positions):
+         origin = positions(idx1)
+         bond_vec = positions(idx2) - origin
+         phi = np.arctan2(bond_vec[..., 1], bond_vec[..., 0])
+         theta = np.arccos(bond_vec[..., 2] / np.linalg.norm(bond_vec, axis=-1))
+         rotmat = np.matmul(axis_rotation(phi, 'z'), axis_rotation(theta, 'y'))
+         return affine_matrix(rotmat, -np.matmul(origin[..., np.newaxis, :], rotmat)[..., 0, :])
+      return self.add_step("align the bond %d-%d to the z axis" %(idx1, idx2), step)
+
+   def describe(self):
+      for istep, (description, step) in enumerate(self.steps):
+         print("step %d: %s" %(istep+1, description))
+
+   #the composed (4, 4) or (nframes, 4, 4) matrices for a geometry or a stack of frames
+   def matrices(self, Coords):
+      Coords = np.asarray(Coords)
+      M = affine_matrix()
+      for description, step in self.steps:
+         positions = lambda idx: np.matmul(Coords[..., idx-1, np.newaxis, :], M[..., :3, :3])[..., 0, :] + M[..., 3, :3]
+         M = np.matmul(M, step(positions))
+      return M
+
+   #transformed coordinates; with in_place the (writable, float) Coords are overwritten
+   def apply(self, Coords, in_place=False):
+      M = self.matrices(Coords)
+      new_Coords = np.matmul(Coords, M[..., :3, :3])
+      new_Coords += M[..., np.newaxis, 3, :3]
+      if in_place:
+         Coords[...] = new_Coords
+         return Coords
+      return new_Coords
+
+#transform XYZ files (same number of atoms: one stacked matmul) into the given outfiles
+def transform_xyz_files(pipeline, xyzfile_list, outfile_list):
+   parsed = [parse_xyz_file(xyzfile) for xyzfile in xyzfile_list]
+   if len(set([len(AtomList) for AtomList, Coords in parsed])) == 1:
+      Frames = pipeline.apply(np.array([Coords for AtomList, Coords in parsed]), in_place=True)
+   else:
+      Frames = [pipeline.apply(Coords, in_place=True) for AtomList, Coords in parsed]
+   for (AtomList, Coords), new_Coords, outfile in zip(parsed, Frames, outfile_list):
+      write_xyz_file(outfile, AtomList, new_Coords)
+   print("%d xyz files transformed" %len(outfile_list))
+
+#transform all the frames of a trajectory (read from its binary store) into a new XYZ trajectory
+def transform_trajectory(pipeline, traj_file, outfile, batch_size=10000):
+   AtomList, Coords, offsets = get_traj_store(traj_file)
+   fw = open(outfile, 'w')
+   for first in range(0, Coords.shape[0], batch_size):
+      Frames = pipeline.apply(np.array(Coords[first:first+batch_size]), in_place=True)
+      for Frame in Frames.tolist():
+         fw.write("%d\n\n" %len(AtomList))
+         fw.write(''.join(["%-3s %15.10f %15.10f %15.10f\n" %(AtomList[iAtom], x, y, z) for iAtom, (x, y, z) in enumerate(Frame)]))
+   fw.close()
+   print("%d frames transformed, written to %s" %(Coords.shape[0], outfile))
+
+#Binary trajectory store
+#An XYZ trajectory (constant number of atoms) is converted in one streaming pass into
+#  [root].npy       (nframes, natoms, 3) float64 coordinates, loaded as a read-only memmap
+#  [root].meta.npz  element list, byte offset of each frame in the XYZ file and the size/mtime of that file
+#The scripts that work on the coordinates (measure_trajectory, identify_HB --traj,
+#carve_solvent_regions --traj, trans_rot --traj) slice the memmap; the frames are only
+#written back out as text through the frame index below.
+def traj_store_root(traj_file):
+   return re.sub('\.xyz$', '', traj_file)
+
+def write_npy_header(fh, shape, header_len=128):
+   #fixed-length header so that the shape can be filled in once all the frames are written
+   header = "{'descr': '<f8', 'fortran_order': False, 'shape': %s, }" %repr(tuple(shape))
+   header = header.ljust(header_len - 11) + '\n'
+   fh.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+def build_traj_store(traj_file, store_root=None):
+   if store_root == None:
+      store_root = traj_store_root(traj_file)
+   fr = open(traj_file, 'rb')
+   fw = open(store_root + '.npy', 'wb')
+   AtomList = None
+   natoms = -1
+   offsets = []
+   pos = 0
+   line = fr.readline()
+   while line != b'':
+      l_sp = line.split()
+      if len(l_sp) == 0:  #blank lines between frames
+         pos += len(line)
+         line = fr.readline()
+         continue
+      if len(l_sp) != 1 or not l_sp[0].isdigit():
+         print("Unexpected line in %s at byte %d: %s" %(traj_file, pos, line.decode().rstrip()))
+         sys.exit(1)
+      if natoms < 0:
+         natoms = int(l_sp[0])
+         write_npy_header(fw, (0, natoms, 3))
+      elif int(l_sp[0]) != natoms:
+         print("Frame %d of %s has %s atoms instead of %d" %(len(offsets)+1, traj_file, l_sp[0].decode(), natoms))
+         sys.exit(1)
+      offsets.append(pos)
+      pos += len(line)
+      line = fr.readline()  #comment line
+      pos += len(line)
+      frame_lines = [fr.readline() for iatom in range(natoms)]
+      pos += sum([len(l) for l in frame_lines])
+      frame = [l.split() for l in frame_lines]
+      if len(frame[-1]) < 4:
+         print("Incomplete last frame in %s" %traj_file)
+         sys.exit(1)
+      if AtomList == None:
+         AtomList = [l[0].decode() for l in frame]
+      fw.write(np.array([l[1:4] for l in frame], dtype=float).tobytes())
+      line = fr.readline()
+   fr.close()
+   fw.seek(0)
+   write_npy_header(fw, (len(offsets), natoms, 3))
+   fw.close()
+   st = os.stat(traj_file)
+   np.savez(store_root + '.meta.npz', elements=np.array(AtomList), offsets=np.array(offsets, dtype=np.int64), source=np.array([st.st_size, st.st_mtime_ns], dtype=np.int64))
+   print("%d frames of %d atoms stored in %s.npy" %(len(offsets), natoms, store_root))
+   return store_root
+
+#elements, (nframes, natoms, 3) memmap, byte offsets of the frames in the source XYZ
+def load_traj_store(store_root):
+   meta = np.load(store_root + '.meta.npz')
+   Coords = np.load(store_root + '.npy', mmap_mode='r')
+   return meta["elements"].tolist(), Coords, meta["offsets"]
+
+def traj_store_is_current(traj_file, store_root=None):
+   if store_root == None:
+      store_root = traj_store_root(traj_file)
+   if not os.path.exists(store_root + '.npy') or not os.path.exists(store_root + '.meta.npz'):
+      return False
+   st = os.stat(traj_file)
+   source = np.load(store_root + '.meta.npz')["source"]
+   return source[0] == st.st_size and source[1] == st.st_mtime_ns
+
+#build the store only if it is missing or older than the trajectory
+def get_traj_store(traj_file, store_root=None):
+   if store_root == None:
+      store_root = traj_store_root(traj_file)
+   if not traj_store_is_current(traj_file, store_root):
+      build_traj_store(traj_file, store_root)
+   return load_traj_store(store_root)
+
+#frames counted from 1 are taken if beyond "offset" and a multiple of "interval", only keeping
+#the first natoms atoms if natoms > 0; returns the selected frame indices (from 0) and a view
+def select_frames(Coords, offset=0, interval=1, natoms=-1):
+   first = ((offset + interval) // interval) * interval - 1
+   if natoms > 0:
+      return np.arange(first, Coords.shape[0], interval), Coords[first::interval, :natoms]
+   return np.arange(first, Coords.shape[0], interval), Coords[first::interval]
+
+def select_frame_indices(nframes, offset=0, interval=1):
+   first = ((offset + interval) // interval) * interval - 1
+   return np.arange(first, nframes, interval)
+
+#Frame index of an XYZ trajectory
+#  [root].index.npz   byte offset of the start of each frame (plus the end of the file),
+#                     number of atoms and the size/mtime of the trajectory
+#The offsets are found in one streaming pass over the raw bytes: with a constant number of
+#atoms and no blank lines between the frames, every (natoms+2)-th line starts a frame, so
+#only the positions of the newlines are needed. Trajectories that do not follow this
+#layout are indexed line by line instead. Frames are then copied by seeking to their offsets,
+#so the exported XYZ files are byte for byte the frames of the trajectory.
+INDEX_BLOCK_BYTES = 1 << 24
+EXPORT_CHUNK = 256
+
+def traj_index_file(traj_file):
+   return traj_store_root(traj_file) + '.index.npz'
+
+#frame starts with a fixed number of lines per frame; None if a header does not match
+def scan_frame_offsets(fr, header, nlines):
+   hdr = np.frombuffer(header, dtype=np.uint8)
+   starts = [np.zeros(1, dtype=np.int64)]
+   nseen = 0   #newlines before the block
+   base = 0    #byte position of the block
+   carry = b''
+   pending = True   #a frame starts at the beginning of the block
+   chunk = fr.read(INDEX_BLOCK_BYTES)
+   while chunk != b'':
+      #only complete lines are scanned, the rest goes with the next block
+      data = carry + chunk
+      last_nl = data.rfind(b'\n')
+      carry = data[last_nl+1:]
+      block = np.frombuffer(data, dtype=np.uint8, count=last_nl+1)
+      nl = np.flatnonzero(block == 10)
+      #line j+1 (from 0) follows newline j and starts a frame if it is a multiple of nlines
+      line_after = np.arange(nseen + 1, nseen + len(nl) + 1)
+      new_starts = nl[line_after % nlines == 0] + 1
+      #the header line of every frame starting inside the block is complete in it
+      local = new_starts[new_starts < len(block)]
+      if pending:
+         local = np.concatenate(([0], local))
+      if len(local) > 0:
+         idx = np.minimum(local[:, None] + np.arange(len(hdr)), len(block) - 1)
+         if not np.all(block[idx] == hdr):
+            return None
+      pending = len(new_starts) > 0 and new_starts[-1] == len(block)
+      starts.append(new_starts + base)
+      nseen += len(nl)
+      base += len(block)
+      chunk = fr.read(INDEX_BLOCK_BYTES)
+   nlines_total = nseen + (1 if len(carry) > 0 else 0)
+   if nlines_total % nlines != 0:
+      return None
+   offsets = np.concatenate(starts)
+   return np.append(offsets[offsets < base + len(carry)], base + len(carry))
+
+#frame starts allowing blank lines between the frames; None if the number of atoms changes
+def scan_frame_offsets_by_line(fr, traj_file, natoms):
+   offsets = []
+   pos = 0
+   line = fr.readline()
+   while line != b'':
+      l_sp = line.split()
+      if len(l_sp) == 0:
+         pos += len(line)
+         line = fr.readline()
+         continue
+      if len(l_sp) != 1 or not l_sp[0].isdigit():
+         print("Unexpected line in %s at byte %d: %s" %(traj_file, pos, line.decode().rstrip()))
+         sys.exit(1)
+      if int(l_sp[0]) != natoms:
+         print("Frame %d of %s has %s atoms instead of %d" %(len(offsets)+1, traj_file, l_sp[0].decode(), natoms))
+         return None
+      offsets.append(pos)
+      for iline in range(natoms + 2):
+         pos += len(line)
+         line = fr.readline()
+   offsets.append(pos)
+   return np.array(offsets, dtype=np.int64)
+
+def build_traj_index(traj_file, index_file=None):
+   if index_file == None:
+      index_file = traj_index_file(traj_file)
+   fr = open(traj_file, 'rb')
+   header = fr.readline()
+   while header != b'' and header.strip() == b'':
+      header = fr.readline()
+   if not header.strip().isdigit():
+      print("%s does not start with the number of atoms" %traj_file)
+      fr.close()
+      return None
+   natoms = int(header)
+   fr.seek(0)
+   offsets = scan_frame_offsets(fr, header, natoms + 2)
+   if offsets is None:
+      fr.seek(0)
+      offsets = scan_frame_offsets_by_line(fr, traj_file, natoms)
+   fr.close()
+   if offsets is None:
+      return None
+   st = os.stat(traj_file)
+   np.savez(index_file, offsets=offsets, natoms=np.int64(natoms), source=np.array([st.st_size, st.st_mtime_ns], dtype=np.int64))
+   print("%d frames of %d atoms indexed in %s" %(len(offsets)-1, natoms, index_file))
+   return offsets, natoms
+
+#offsets (nframes+1) and natoms; the index is rebuilt if missing or older than the trajectory
+#None if the trajectory can not be indexed (the number of atoms changes along it)
+def get_traj_index(traj_file, index_file=None):
+   if index_file == None:
+      index_file = traj_index_file(traj_file)
+   if os.path.exists(index_file):
+      st = os.stat(traj_file)
+      index = np.load(index_file)
+      if index["source"][0] == st.st_size and index["source"][1] == st.st_mtime_ns:
+         return index["offsets"], int(index["natoms"])
+   return build_traj_index(traj_file, index_file)
+
+#the frame in [start, end) written as an XYZ file with a blank comment line, keeping the
+#first "keep" atoms if keep > 0; header: the first line, the original one if None
+def copy_frame(fr, fw, start, end, natoms, header=None, keep=-1):
+   fr.seek(start)
+   lines = fr.read(end - start).split(b'\n')
+   if keep > 0:
+      natoms = min(natoms, keep)
+   fw.write((lines[0] + b'\n') if header == None else header)
+   fw.write(b'\n')
+   fw.write(b'\n'.join(lines[2:2+natoms]) + b'\n')
+
+#task: (traj_file, [(start, end, outfile), ...], natoms, header, keep)
+def copy_frames_worker(task):
+   traj_file, frame_list, natoms, header, keep = task
+   fr = open(traj_file, 'rb')
+   for start, end, outfile in frame_list:
+      fw = open(outfile, 'wb')
+      copy_frame(fr, fw, start, end, natoms, header, keep)
+      fw.close()
+   fr.close()
+   return len(frame_list)
+
+#write the frames frame_idx (from 0) of an indexed trajectory to outfile_list
+def export_frames(traj_file, offsets, natoms, frame_idx, outfile_list, header=None, keep=-1, nproc=1):
+   frame_list = list(zip(offsets[frame_idx].tolist(), offsets[np.asarray(frame_idx)+1].tolist(), outfile_list))
+   tasks = [(traj_file, frame_list[i:i+EXPORT_CHUNK], natoms, header, keep) for i in range(0, len(frame_list), EXPORT_CHUNK)]
+   return sum(qcrawl.map_files(copy_frames_worker, tasks, nproc))
+
+#Hydrogen bond detection
+#Donor-hydrogen pairs are given as two parallel lists of atomic indices (from 1; a donor with two
+#hydrogens appears twice) and acceptors as a list of atomic indices. A pair (DH, A) is H-bonded if
+#the D...A distance is below r_cut and the H-D...A angle is below theta_cut (degrees).
+#Candidate D...A pairs are found with a cell list of edge r_cut unless the system is small enough
+#for all the distances to be computed at once.
+HB_DENSE_MAX = 65536
+
+#positions (in CoordsD, CoordsA) of the pairs closer than r_cut
+def neighbor_pairs(CoordsD, CoordsA, r_cut):
+   if len(CoordsD) * len(CoordsA) <= HB_DENSE_MAX:
+      dist = np.linalg.norm(CoordsA[np.newaxis, :, :] - CoordsD[:, np.newaxis, :], axis=2)
+      return np.nonzero(dist < r_cut)
+   origin = np.minimum(CoordsD.min(axis=0), CoordsA.min(axis=0))
+   #shift by one cell so that the neighboring cells of every donor have non-negative indices
+   cellD = np.floor((CoordsD - origin) / r_cut).astype(np.int64) + 1
+   cellA = np.floor((CoordsA - origin) / r_cut).astype(np.int64) + 1
+   ncell = np.maximum(cellD.max(axis=0), cellA.max(axis=0)) + 2
+   keyA = (cellA[:, 0] * ncell[1] + cellA[:, 1]) * ncell[2] + cellA[:, 2]
+   orderA = np.argsort(keyA, kind='stable')
+   keyA = keyA[orderA]
+   pairs_D, pairs_A = [], []
+   for shift in np.array(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing='ij')).reshape(3, -1).T:
+      cell = cellD + shift
+      keyD = (cell[:, 0] * ncell[1] + cell[:, 1]) * ncell[2] + cell[:, 2]
+      begin = np.searchsorted(keyA, keyD, side='left')
+      counts = np.searchsorted(keyA, keyD, side='right') - begin
+      ntot = counts.sum()
+      if ntot == 0:
+         continue
+      iD = np.repeat(np.arange(len(CoordsD)), counts)
+      iA = np.arange(ntot) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(begin, counts)
+      pairs_D.append(iD)
+      pairs_A.append(orderA[iA])
+   if len(pairs_D) == 0:
+      return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+   iD, iA = np.concatenate(pairs_D), np.concatenate(pairs_A)
+   keep = np.linalg.norm(CoordsA[iA] - CoordsD[iD], axis=1) < r_cut
+   return iD[keep], iA[keep]
+
+#D...A distances and H-D...A angles for parallel index arrays; Coords may hold a stack of frames
+def hbond_geometry(Coords, idx_D, idx_H, idx_A):
+   vec_DA = bond_vectors(Coords, idx_D, idx_A)
+   vec_DH = bond_vectors(Coords, idx_D, idx_H)
+   return np.linalg.norm(vec_DA, axis=-1), vector_angles(vec_DA, vec_DH)
+
+#H-bonds in one frame: positions in the donor-hydrogen list and in the acceptor list, sorted by donor then acceptor
+def find_hbonds(Coords, idx_D, idx_H, idx_A, r_cut, theta_cut):
+   idx_D, idx_H, idx_A = np.asarray(idx_D), np.asarray(idx_H), np.asarray(idx_A)
+   iDH, iA = neighbor_pairs(Coords[idx_D-1], Coords[idx_A-1], r_cut)
+   dist, angle = hbond_geometry(Coords, idx_D[iDH], idx_H[iDH], idx_A[iA])
+   keep = angle < theta_cut
+   iDH, iA = iDH[keep], iA[keep]
+   order = np.lexsort((iA, iDH))
+   return iDH[order], iA[order]
+
+#H-bond masks (nframes, nDH, nA) for a stack of frames, computed batch_size frames at a time;
+#only meant for small donor/acceptor sets (e.g. one solute site against the solvent molecules)
+def hbond_mask_frames(Frames, idx_D, idx_H, idx_A, r_cut, theta_cut, batch_size=1024):
+   idx_D, idx_H, idx_A = np.asarray(idx_D), np.asarray(idx_H), np.asarray(idx_A)
+   nDH, nA = len(idx_D), len(idx_A)
+   D_all = np.repeat(idx_D, nA)
+   H_all = np.repeat(idx_H, nA)
+   A_all = np.tile(idx_A, nDH)
+   mask = np.zeros((Frames.shape[0], nDH, nA), dtype=bool)
+   for first in range(0, Frames.shape[0], batch_size):
+      dist, angle = hbond_geometry(Frames[first:first+batch_size], D_all, H_all, A_all)
+      mask[first:first+batch_size] = ((dist < r_cut) & (angle < theta_cut)).reshape(-1, nDH, nA)
+   return mask
+
+#find_hbonds over the frames of a trajectory, for large systems where the dense masks do not fit
+def find_hbonds_frames(Frames, idx_D, idx_H, idx_A, r_cut, theta_cut):
+   return [find_hbonds(Frames[iframe], idx_D, idx_H, idx_A, r_cut, theta_cut) for iframe in range(Frames.shape[0])]